@@ -0,0 +1,131 @@
+"""asyncio variant of the deck generation pipeline, used by the ASGI web API.
+
+LLM requests for all chunks run concurrently on the event loop (bounded by a semaphore),
+while CPU-bound PDF extraction is offloaded to an executor, typically a process pool.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+import tempfile
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Callable, Optional
+
+import click
+
+from pdf_to_anki_flashcard_generator.main import (
+    _build_qna_messages,
+    _parse_multiple_qna_from_llm_response,
+    _report_invalid_formulas,
+    extract_chunks,
+    write_deck_from_store,
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+ProgressCallback = Callable[[dict], None]
+
+async def _agenerate_multiple_qna_from_chunk_via_llm(client: AsyncOpenAI, text_chunk: str, model: str) -> list[tuple[str, str]] | None:
+    """Async counterpart of `_generate_multiple_qna_from_chunk_via_llm`."""
+    try:
+        completion = await client.chat.completions.create(
+            model=model,
+            messages=_build_qna_messages(text_chunk),
+            temperature=0.2
+        )
+
+        llm_response = completion.choices[0].message.content
+        if llm_response:
+            return _parse_multiple_qna_from_llm_response(llm_response)
+        return []
+
+    except Exception as e:
+        click.echo(f"Warning: LLM request failed for a chunk: {e}", err=True)
+        return None
+
+async def agenerate_anki_deck(
+    client: AsyncOpenAI,
+    pdf_path: str,
+    output_file: Optional[str],
+    deck_name: str,
+    model: str,
+    max_chars_per_chunk: int,
+    anki_model_name: str,
+    executor: Optional[Executor] = None,
+    concurrency: int = 8,
+    on_progress: Optional[ProgressCallback] = None,
+    stats: Optional[dict] = None,
+    llm_semaphore: Optional[asyncio.Semaphore] = None,
+    card_store_path: Optional[str] = None,
+) -> str | None:
+    """Async counterpart of `generate_anki_deck`.
+
+    Chunks are sent to the LLM concurrently (at most `concurrency` requests at a time, and
+    additionally bounded by `llm_semaphore`, which can be shared across jobs) and cards are
+    spooled to a CardStore at `card_store_path` (a temporary file if None) as they arrive.
+    `on_progress` is called with a dict for every processed chunk. `stats` is updated like
+    in `generate_anki_deck`. With `output_file=None` only the card store is filled.
+    Returns the path of the written deck (or of the card store), or None if no flashcards
+    were generated.
+    """
+    from pdf_to_anki_flashcard_generator.card_store import CardStore
+
+    if output_file is None and card_store_path is None:
+        raise ValueError("Either output_file or card_store_path is required.")
+
+    def report(event: dict) -> None:
+        if on_progress is not None:
+            on_progress(event)
+
+    loop = asyncio.get_running_loop()
+    chunks = await loop.run_in_executor(executor, extract_chunks, pdf_path, max_chars_per_chunk)
+    if not chunks:
+        click.echo(f"No text chunks could be generated from {pdf_path}.")
+        return None
+    report({"event": "segmented", "chunks": len(chunks)})
+
+    keep_card_store = card_store_path is not None
+    if card_store_path is None:
+        fd, card_store_path = tempfile.mkstemp(prefix="ankicardgen_cards_", suffix=".sqlite")
+        os.close(fd)
+    try:
+        with CardStore(card_store_path) as store:
+            semaphore = asyncio.Semaphore(concurrency)
+            processed_chunks = 0
+            skipped_chunks = 0
+            failed_chunks = 0
+            total_cards_generated = 0
+
+            async def process_chunk(index: int, chunk: str) -> None:
+                nonlocal processed_chunks, skipped_chunks, failed_chunks, total_cards_generated
+                async with semaphore, (llm_semaphore or contextlib.nullcontext()):
+                    cards = await _agenerate_multiple_qna_from_chunk_via_llm(client, chunk, model)
+                # Single-threaded event loop: the store is never written concurrently
+                if cards is None:
+                    failed_chunks += 1
+                elif cards:
+                    _report_invalid_formulas(cards)
+                    store.add_cards(index, cards)
+                    total_cards_generated += len(cards)
+                else:
+                    skipped_chunks += 1
+                processed_chunks += 1
+                report({"event": "chunk", "processed": processed_chunks, "chunks": len(chunks), "cards": total_cards_generated, "failed": failed_chunks})
+
+            await asyncio.gather(*(process_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+            if stats is not None:
+                stats.update(cards=total_cards_generated, skipped_chunks=skipped_chunks, failed_chunks=failed_chunks)
+
+            if total_cards_generated == 0:
+                click.echo(f"No flashcards were generated from {pdf_path}.")
+                return None
+            if output_file is None:
+                return card_store_path
+
+            # Writing the .apkg is blocking file and SQLite I/O, keep it off the event loop
+            return await asyncio.to_thread(write_deck_from_store, store, output_file, deck_name, anki_model_name)
+    finally:
+        if not keep_card_store and os.path.exists(card_store_path):
+            os.remove(card_store_path)
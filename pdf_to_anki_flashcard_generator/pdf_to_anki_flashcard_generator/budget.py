@@ -0,0 +1,110 @@
+"""Token counting, cost estimation and budget tracking for LLM requests."""
+from __future__ import annotations
+
+import math
+from typing import NamedTuple
+
+# Fallback when tiktoken is not installed: German lecture text averages roughly 3.5
+# characters per token with the OpenAI tokenizers, so this errs on the high side.
+CHARS_PER_TOKEN = 3.5
+# Per-message overhead of the chat format
+TOKENS_PER_MESSAGE = 4
+# Expected completion size of a chunk (up to 5 cards incl. LaTeX) until real usage is known
+DEFAULT_EXPECTED_COMPLETION_TOKENS = 600
+
+class ModelPricing(NamedTuple):
+    """Price in USD per million prompt and completion tokens."""
+    prompt: float
+    completion: float
+
+# Openrouter list prices; pass --price-prompt/--price-completion for other models or when they change
+KNOWN_PRICING = {
+    "openai/gpt-3.5-turbo": ModelPricing(0.5, 1.5),
+    "openai/gpt-4o": ModelPricing(2.5, 10.0),
+    "openai/gpt-4o-mini": ModelPricing(0.15, 0.6),
+    "openai/gpt-4.1": ModelPricing(2.0, 8.0),
+    "openai/gpt-4.1-mini": ModelPricing(0.4, 1.6),
+    "openai/gpt-4.1-nano": ModelPricing(0.1, 0.4),
+}
+
+def resolve_pricing(model: str, prompt_price: float | None = None, completion_price: float | None = None) -> ModelPricing | None:
+    """Returns the pricing for a model, with explicit prices taking precedence over the
+    built-in table. Returns None if the price is unknown."""
+    known = KNOWN_PRICING.get(model)
+    if prompt_price is not None and completion_price is not None:
+        return ModelPricing(prompt_price, completion_price)
+    if known is None:
+        return None
+    return ModelPricing(
+        prompt_price if prompt_price is not None else known.prompt,
+        completion_price if completion_price is not None else known.completion,
+    )
+
+class TokenCounter:
+    """Counts tokens locally with tiktoken if it is installed, otherwise estimates them
+    from the text length."""
+
+    def __init__(self, model: str):
+        self._encoding = None
+        try:
+            import tiktoken
+
+            encoding_name = "o200k_base" if ("gpt-4o" in model or "gpt-4.1" in model) else "cl100k_base"
+            self._encoding = tiktoken.get_encoding(encoding_name)
+            self.method = f"tiktoken ({encoding_name})"
+        except Exception:
+            # Not installed, or the encoding could not be downloaded
+            self.method = f"estimate ({CHARS_PER_TOKEN} characters per token)"
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def count_messages(self, messages: list[dict[str, str]]) -> int:
+        return sum(self.count(message["content"]) + TOKENS_PER_MESSAGE for message in messages)
+
+def cost(pricing: ModelPricing, prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * pricing.prompt + completion_tokens * pricing.completion) / 1_000_000
+
+class CostTracker:
+    """Accumulates the actual token usage reported by the API and checks it against a budget."""
+
+    def __init__(self, pricing: ModelPricing | None, budget: float | None = None):
+        self.pricing = pricing
+        self.budget = budget
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Set once a run stopped because the next request would have exceeded the budget
+        self.exhausted = False
+
+    def record(self, usage) -> None:
+        """Records the `usage` of a chat completion response."""
+        if usage is None:
+            return
+        self.add(usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+    def add(self, prompt_tokens: int, completion_tokens: int, requests: int = 1) -> None:
+        """Adds token usage, e.g. the usage recorded before a run was resumed from a checkpoint."""
+        self.requests += requests
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    @property
+    def cost(self) -> float | None:
+        if self.pricing is None:
+            return None
+        return cost(self.pricing, self.prompt_tokens, self.completion_tokens)
+
+    def expected_completion_tokens(self) -> int:
+        """Average completion size observed so far, or the default before the first request."""
+        if self.requests == 0:
+            return DEFAULT_EXPECTED_COMPLETION_TOKENS
+        return math.ceil(self.completion_tokens / self.requests)
+
+    def can_afford(self, prompt_tokens: int, completion_tokens: int) -> bool:
+        """Whether a request of the given size still fits into the budget."""
+        if self.budget is None or self.pricing is None:
+            return True
+        return self.cost + cost(self.pricing, prompt_tokens, completion_tokens) <= self.budget
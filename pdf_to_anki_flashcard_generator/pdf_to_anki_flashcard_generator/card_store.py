@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterator
+
+class CardStore:
+    """Append-only SQLite spool for generated flashcards.
+
+    Cards are written to disk as soon as they are generated, so a job's memory use does
+    not grow with the number of cards. The store can be kept after a run and used as a
+    source for building or re-exporting decks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # The store may be filled on an event loop and exported from a worker thread;
+        # callers never use it from two threads at the same time.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # The store is a spool, not a system of record: trade durability for write speed.
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_index INTEGER NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL
+            )"""
+        )
+        # Progress of the run that fills the store, so an interrupted run can be resumed
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def add_cards(self, chunk_index: int, cards: list[tuple[str, str]]) -> None:
+        """Appends the (question, answer) pairs generated for one chunk."""
+        self._conn.executemany(
+            "INSERT INTO cards (chunk_index, question, answer) VALUES (?, ?, ?)",
+            [(chunk_index, question, answer) for question, answer in cards],
+        )
+        self._conn.commit()
+
+    def get_meta(self, key: str) -> str | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.update_meta({key: value})
+
+    def update_meta(self, values: dict[str, str]) -> None:
+        """Sets several meta values in one transaction."""
+        self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", list(values.items()))
+        self._conn.commit()
+
+    def iter_cards(self, batch_size: int = 500) -> Iterator[tuple[str, str]]:
+        """Yields the stored (question, answer) pairs in document order, fetching them in batches."""
+        cursor = self._conn.execute("SELECT question, answer FROM cards ORDER BY chunk_index, id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "CardStore":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
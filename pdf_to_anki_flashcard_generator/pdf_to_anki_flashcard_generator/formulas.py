@@ -0,0 +1,168 @@
+"""Validation and PNG rendering for the LaTeX formulas in generated cards.
+
+Cards mark formulas with \\( \\) (inline) and \\[ \\] (display), as demanded by the prompt.
+Anki renders these with MathJax; for clients without MathJax the formulas can be replaced
+by PNG images (PRD F4). Rendered images are cached by content hash, so identical formulas
+are rendered once no matter how many cards contain them.
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, NamedTuple
+
+# Inline \( ... \) or display \[ ... \]
+MATH_SPAN_RE = re.compile(r'\\\((.+?)\\\)|\\\[(.+?)\\\]', re.DOTALL)
+# Math delimiters; `\\` (a TeX line break, e.g. `\\[2pt]`) is matched first so it is skipped
+_DELIMITER_RE = re.compile(r'\\\\|\\[()\[\]]')
+_CLOSING_DELIMITERS = {'\\(': '\\)', '\\[': '\\]'}
+
+DEFAULT_FORMULA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ankicardgen", "formulas")
+
+class MathSpan(NamedTuple):
+    tex: str
+    display: bool
+
+def extract_math_spans(text: str) -> list[MathSpan]:
+    """Returns all inline and display formulas in a card field."""
+    spans = []
+    for match in MATH_SPAN_RE.finditer(text):
+        if match.group(1) is not None:
+            spans.append(MathSpan(match.group(1), display=False))
+        else:
+            spans.append(MathSpan(match.group(2), display=True))
+    return spans
+
+def _check_delimiters(text: str) -> list[str]:
+    errors = []
+    open_delimiter = None
+    for match in _DELIMITER_RE.finditer(text):
+        token = match.group()
+        if token == '\\\\':
+            continue
+        if token in _CLOSING_DELIMITERS:
+            if open_delimiter is not None:
+                errors.append(f"'{token}' opened inside '{open_delimiter}'")
+            else:
+                open_delimiter = token
+        elif open_delimiter is not None and token == _CLOSING_DELIMITERS[open_delimiter]:
+            open_delimiter = None
+        else:
+            errors.append(f"unexpected '{token}'")
+    if open_delimiter is not None:
+        errors.append(f"unclosed '{open_delimiter}'")
+    return errors
+
+def _check_tex(tex: str) -> list[str]:
+    if not tex.strip():
+        return ["empty formula"]
+
+    errors = []
+    depth = 0
+    # `\\.` consumes escaped characters such as \{ and \} so they do not count as groups
+    for match in re.finditer(r'\\.|[{}]', tex, re.DOTALL):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth < 0:
+                errors.append("unmatched '}'")
+                depth = 0
+    if depth > 0:
+        errors.append("unclosed '{'")
+
+    lefts = len(re.findall(r'\\left(?![a-zA-Z])', tex))
+    rights = len(re.findall(r'\\right(?![a-zA-Z])', tex))
+    if lefts != rights:
+        errors.append(f"{lefts} \\left but {rights} \\right")
+
+    environments = []
+    for kind, name in re.findall(r'\\(begin|end)\{([^}]*)\}', tex):
+        if kind == 'begin':
+            environments.append(name)
+        elif not environments or environments.pop() != name:
+            errors.append(f"unmatched \\end{{{name}}}")
+    for name in environments:
+        errors.append(f"unclosed \\begin{{{name}}}")
+    return errors
+
+def validate_math(text: str) -> list[str]:
+    """Checks the formulas of a card field: balanced \\( \\) / \\[ \\] delimiters and, for
+    every formula, balanced braces, \\left/\\right pairs and environments.
+    Returns a list of error messages (empty if the field is valid)."""
+    errors = _check_delimiters(text)
+    for span in extract_math_spans(text):
+        errors.extend(f"{error} in '{span.tex.strip()}'" for error in _check_tex(span.tex))
+    return errors
+
+def formula_filename(span: MathSpan) -> str:
+    """Content-addressed media file name of a formula's PNG rendering."""
+    key_source = f"{'display' if span.display else 'inline'}\0{span.tex.strip()}"
+    return f"ankicardgen_formula_{hashlib.sha256(key_source.encode('utf-8')).hexdigest()[:20]}.png"
+
+def render_formula_png(span: MathSpan, path: str) -> None:
+    """Renders a formula to a PNG file with matplotlib's mathtext (no LaTeX installation needed)."""
+    from matplotlib import mathtext
+    from matplotlib.font_manager import FontProperties
+
+    # Write to a temporary file first so concurrent renderers never expose a partial image
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".png.tmp")
+    os.close(fd)
+    try:
+        mathtext.math_to_image(
+            f"${span.tex.strip()}$",
+            tmp_path,
+            prop=FontProperties(size=16 if span.display else 13),
+            dpi=200,
+            format="png",
+        )
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _render_to_cache(span: MathSpan, cache_dir: str) -> str | None:
+    """Process pool worker: renders one formula into the cache, returns an error message or None."""
+    try:
+        render_formula_png(span, os.path.join(cache_dir, formula_filename(span)))
+        return None
+    except Exception as e:
+        return str(e)
+
+def render_formula_pngs(spans: Iterable[MathSpan], cache_dir: str = DEFAULT_FORMULA_CACHE_DIR, max_workers: int | None = None) -> tuple[dict[MathSpan, str], dict[MathSpan, str]]:
+    """Renders PNG images for the given formulas, reusing cached images.
+
+    Duplicate formulas are rendered once; formulas missing from the cache are rendered in
+    a process pool. Returns (images, errors): the image path for every formula that could
+    be rendered, and the error message for every formula that could not.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    unique_spans = {MathSpan(span.tex.strip(), span.display) for span in spans}
+    missing = [span for span in unique_spans if not os.path.exists(os.path.join(cache_dir, formula_filename(span)))]
+
+    errors = {}
+    if missing:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for span, error in zip(missing, executor.map(_render_to_cache, missing, [cache_dir] * len(missing))):
+                if error is not None:
+                    errors[span] = error
+
+    images = {span: os.path.join(cache_dir, formula_filename(span)) for span in unique_spans if span not in errors}
+    return images, errors
+
+def replace_math_with_images(text: str, images: dict[MathSpan, str]) -> str:
+    """Replaces every rendered formula in a card field with an <img> tag for its PNG.
+    Formulas without an image are left as they are, so MathJax can still render them."""
+    def replace(match: re.Match) -> str:
+        tex, display = (match.group(1), False) if match.group(1) is not None else (match.group(2), True)
+        path = images.get(MathSpan(tex.strip(), display))
+        if path is None:
+            return match.group(0)
+        css_class = "formula-display" if display else "formula-inline"
+        return f'<img src="{os.path.basename(path)}" class="{css_class}" alt="{html.escape(match.group(0))}">'
+    return MATH_SPAN_RE.sub(replace, text)
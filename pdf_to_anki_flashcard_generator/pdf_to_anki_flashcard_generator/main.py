@@ -1,21 +1,103 @@
+from __future__ import annotations
+
 import click
-import fitz  # PyMuPDF
+import contextlib
+import functools
+import math
+import importlib.util
 import re
 import os
+import shlex
+import tempfile
+import threading
 import random # For generating unique IDs
+import shutil
 import time # For generating unique IDs
-from openai import OpenAI
-from dotenv import load_dotenv
-import genanki # Added for Anki deck generation
-
-# Helper function to initialize OpenAI client for Openrouter
-def get_openrouter_client():
-    load_dotenv() 
+from typing import TYPE_CHECKING
+
+# Heavy dependencies (fitz, openai, httpx, dotenv, genanki) are imported lazily inside the
+# functions that need them, so `ankicardgen --help`, shell completion and short batch
+# invocations start without paying for the full import graph.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+    from pdf_to_anki_flashcard_generator.card_store import CardStore
+    import numpy as np
+    from pdf_to_anki_flashcard_generator.budget import CostTracker
+    from pdf_to_anki_flashcard_generator.formulas import MathSpan
+    from pdf_to_anki_flashcard_generator.vector_index import VectorIndex
+
+# Local vector index over chunks and cards of all generated decks
+DEFAULT_INDEX_DIR = os.getenv("ANKICARDGEN_INDEX_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "ankicardgen", "index"))
+CONTEXT_SNIPPET_CHARS = 400
+
+@functools.cache
+def _load_env() -> None:
+    """Loads the .env file once per process."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+# Process-wide registry of Openrouter clients, keyed by (api_key, base_url).
+# Every client owns a pooled httpx connection pool, so reusing it across chunks,
+# batch files and web API jobs keeps TCP/TLS connections alive between requests.
+_client_registry: dict[tuple[str, str], OpenAI] = {}
+_async_client_registry: dict[tuple[str, str], AsyncOpenAI] = {}
+_client_registry_lock = threading.Lock()
+
+def _http_client_options(pool_timeout: bool = True) -> dict:
+    """Returns the httpx client options: keep-alive pooling, HTTP/2 (if `h2` is installed) and timeouts.
+    Pool size and timeouts are tunable via environment variables. Without `pool_timeout`,
+    requests wait for a free pooled connection indefinitely instead of failing with PoolTimeout."""
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("OPENROUTER_MAX_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60")),
+    )
+    timeout = httpx.Timeout(
+        float(os.getenv("OPENROUTER_TIMEOUT", "120")),
+        connect=float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10")),
+        pool=float(os.getenv("OPENROUTER_POOL_TIMEOUT", "120")) if pool_timeout else None,
+    )
+    use_http2 = os.getenv("OPENROUTER_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+    return {"limits": limits, "timeout": timeout, "http2": use_http2}
+
+def _openrouter_credentials() -> tuple[str, str]:
+    _load_env()
     api_key = os.getenv("OPENROUTER_API_KEY")
     base_url = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
     if not api_key:
         raise click.ClickException("OPENROUTER_API_KEY not found in .env file or environment variables.")
-    return OpenAI(api_key=api_key, base_url=base_url)
+    return api_key, base_url
+
+# Helper function to get the shared OpenAI client for Openrouter
+def get_openrouter_client() -> OpenAI:
+    import httpx
+    from openai import OpenAI
+
+    api_key, base_url = _openrouter_credentials()
+    with _client_registry_lock:
+        client = _client_registry.get((api_key, base_url))
+        if client is None:
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=httpx.Client(**_http_client_options()))
+            _client_registry[(api_key, base_url)] = client
+    return client
+
+# Helper function to get the shared AsyncOpenAI client for Openrouter (used by the ASGI web API).
+# Async clients are bound to the event loop they are first used on, so call this from a single loop.
+# The ASGI app bounds its in-flight LLM requests to the pool size itself, so waiting for a
+# pooled connection has no timeout here.
+def get_async_openrouter_client() -> AsyncOpenAI:
+    import httpx
+    from openai import AsyncOpenAI
+
+    api_key, base_url = _openrouter_credentials()
+    with _client_registry_lock:
+        client = _async_client_registry.get((api_key, base_url))
+        if client is None:
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=httpx.AsyncClient(**_http_client_options(pool_timeout=False)))
+            _async_client_registry[(api_key, base_url)] = client
+    return client
 
 # Helper function to generate a somewhat unique ID for decks/models
 def generate_unique_id(name: str) -> int:
@@ -24,6 +106,22 @@ def generate_unique_id(name: str) -> int:
     timestamp_component = int(time.time() * 1000) % 100000 # Use milliseconds part
     return abs(name_hash + timestamp_component + random.randint(100000, 999999))
 
+def extract_pdf_text(pdf_path: str) -> str:
+    """Extracts the text of all pages of a PDF."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(pdf_path)
+    extracted_text = ""
+    for page_num in range(len(doc)):
+        page = doc.load_page(page_num)
+        extracted_text += page.get_text()
+    return extracted_text
+
+def extract_chunks(pdf_path: str, max_chars_per_chunk: int) -> list[str]:
+    """Extracts and segments the text of a PDF. Module-level so it can run in a process pool:
+    PyMuPDF must not be used from several threads at once."""
+    return segment_text_to_chunks(extract_pdf_text(pdf_path), max_chars_per_chunk)
+
 def segment_text_to_chunks(text: str, max_chars: int) -> list[str]:
     """Segments text into chunks, trying to respect paragraphs and then sentences."""
     paragraphs = text.split('\n\n')
@@ -141,12 +239,11 @@ def _parse_multiple_qna_from_llm_response(llm_response: str) -> list[tuple[str,
     # No valid cards found
     return []
 
-def _generate_multiple_qna_from_chunk_via_llm(client: OpenAI, text_chunk: str, model: str, anki_model_name: str) -> list[tuple[str, str]]:
-    """Generates multiple Q/A pairs from a text chunk using LLM.
-    Returns a list of (question, answer) tuples."""
-    try:
-        # Enhanced prompt for multiple card extraction with improved LaTeX instructions
-        prompt_template = f"""Erstelle evidenzbasierte Karteikarten auf Deutsch zum folgenden Text über Algorithmen und Datenstrukturen.
+def _build_qna_messages(text_chunk: str, context_snippets: list[str] | None = None) -> list[dict[str, str]]:
+    """Builds the chat messages asking the LLM for multiple Q/A pairs for a text chunk.
+    `context_snippets` (e.g. related earlier sections) are added as background only."""
+    # Enhanced prompt for multiple card extraction with improved LaTeX instructions
+    prompt_template = f"""Erstelle evidenzbasierte Karteikarten auf Deutsch zum folgenden Text über Algorithmen und Datenstrukturen.
 
 WISSENSCHAFTLICHE BASIS & BEGRÜNDUNG:
 - Der "Testing Effect" belegt, dass aktives Wissensabrufen die Gedächtnisleistung stärker fördert als passives Wiederholen
@@ -191,23 +288,38 @@ A: [Deine präzise Antwort auf Deutsch]
 
 Usw. für jedes Konzept, das du identifizierst (max. 5 Karten pro Text).
 
-INPUT-TEXT:
+{{context}}INPUT-TEXT:
 {{chunk}}"""
-        
+
+    context = ""
+    if context_snippets:
+        context = "KONTEXT AUS VERWANDTEN ABSCHNITTEN (nur zum Verständnis, z. B. für Definitionen; erstelle daraus KEINE eigenen Karteikarten):\n"
+        context += "".join(f"---\n{snippet}\n" for snippet in context_snippets) + "---\n\n"
+
+    return [
+        {
+            "role": "system",
+            "content": "Du bist ein Experte für wissenschaftlich fundierte Lernmethoden und Gedächtnisforschung mit Spezialwissen in aktiver Wissensabruf-Praxis (Testing Effect), Spaced Repetition und kognitiver Belastungstheorie. Deine Aufgabe ist es, komplexe Informationen in mehrere atomare, evidenzbasierte Anki-Karteikarten zu zerlegen, die jeweils genau ein Konzept abdecken. Du erzeugst ausschließlich Karteikarten auf Deutsch für den Bereich Informatik/Algorithmen. Wichtig: Nutze für alle mathematischen Ausdrücke und Formeln die korrekte LaTeX-Syntax mit \\( und \\) für inline-Formeln oder \\[ und \\] für display-Formeln."
+        },
+        {
+            "role": "user", 
+            "content": prompt_template.format(chunk=text_chunk, context=context)
+        }
+    ]
+
+def _generate_multiple_qna_from_chunk_via_llm(client: OpenAI, text_chunk: str, model: str, anki_model_name: str, context_snippets: list[str] | None = None, cost_tracker: CostTracker | None = None) -> list[tuple[str, str]] | None:
+    """Generates multiple Q/A pairs from a text chunk using LLM.
+    The token usage of the request is recorded in `cost_tracker`, if given.
+    Returns a list of (question, answer) tuples (empty if the chunk was skipped),
+    or None if the LLM request failed."""
+    try:
         completion = client.chat.completions.create(
             model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Du bist ein Experte für wissenschaftlich fundierte Lernmethoden und Gedächtnisforschung mit Spezialwissen in aktiver Wissensabruf-Praxis (Testing Effect), Spaced Repetition und kognitiver Belastungstheorie. Deine Aufgabe ist es, komplexe Informationen in mehrere atomare, evidenzbasierte Anki-Karteikarten zu zerlegen, die jeweils genau ein Konzept abdecken. Du erzeugst ausschließlich Karteikarten auf Deutsch für den Bereich Informatik/Algorithmen. Wichtig: Nutze für alle mathematischen Ausdrücke und Formeln die korrekte LaTeX-Syntax mit \\( und \\) für inline-Formeln oder \\[ und \\] für display-Formeln."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt_template.format(chunk=text_chunk)
-                }
-            ],
+            messages=_build_qna_messages(text_chunk, context_snippets),
             temperature=0.2 # Etwas höhere Temperatur für mehr Kreativität bei der Zerlegung
         )
+        if cost_tracker is not None:
+            cost_tracker.record(completion.usage)
         
         llm_response = completion.choices[0].message.content
         if llm_response:
@@ -216,7 +328,7 @@ INPUT-TEXT:
 
     except Exception as e:
         click.echo(f"Warning: LLM request failed for a chunk: {e}", err=True)
-        return []
+        return None
 
 @click.group()
 def cli():
@@ -232,62 +344,33 @@ def hello(name: str):
     """Simple program that greets NAME."""
     click.echo(f"Hello {name}!")
 
-@cli.command(name="process-pdf-to-anki")
-@click.argument('pdf_path', type=click.Path(exists=True, dir_okay=False, readable=True))
-@click.option('--output-file', default="output_deck.apkg", show_default=True, help='Name of the generated .apkg file.')
-@click.option('--deck-name', default="Generated Anki Deck", show_default=True, help='Name of the Anki deck.')
-@click.option('--model', default=os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo"), show_default=True, help="The Openrouter model for card generation.")
-@click.option('--max-chars-per-chunk', default=1800, show_default=True, help='Maximum characters per text chunk for LLM processing.')
-@click.option('--anki-model-name', default='Basic (Simple Q&A)', show_default=True, help='Name for the Anki card model to be created.')
-def process_pdf_to_anki(pdf_path: str, output_file: str, deck_name: str, model: str, max_chars_per_chunk: int, anki_model_name: str):
-    """Processes a PDF, generates Q/A flashcards via LLM, and creates an .apkg Anki deck.
-
-    PDF_PATH: The path to the PDF file to process.
-    """
-    try:
-        client = get_openrouter_client()
-        click.echo(f"Processing {pdf_path} to create Anki deck '{deck_name}'...")
-
-        doc = fitz.open(pdf_path)
-        extracted_text = ""
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            extracted_text += page.get_text()
-
-        if not extracted_text.strip():
-            click.echo(f"No text found in {pdf_path}.")
-            return
-
-        chunks = segment_text_to_chunks(extracted_text, max_chars_per_chunk)
-        if not chunks:
-            click.echo("No text chunks could be generated.")
-            return
-        
-        click.echo(f"Segmented PDF into {len(chunks)} chunks.")
-
-        # Define Anki model (simple Q/A)
-        # PRD F3: Kartentypen: "Frage/Antwort", "Cloze Deletion" - Starting with Q/A
-        anki_card_model = genanki.Model(
-            model_id=generate_unique_id(anki_model_name), # Unique ID for the model
-            name=anki_model_name,
-            fields=[
-                {'name': 'Question'}, 
-                {'name': 'Answer'}
-            ],
-            templates=[
-                {
-                    'name': 'Card 1',
-                    'qfmt': '''
+def _create_anki_card_model(anki_model_name: str):
+    """Creates the genanki note model used for all generated cards."""
+    import genanki
+
+    # Define Anki model (simple Q/A)
+    # PRD F3: Kartentypen: "Frage/Antwort", "Cloze Deletion" - Starting with Q/A
+    return genanki.Model(
+        model_id=generate_unique_id(anki_model_name), # Unique ID for the model
+        name=anki_model_name,
+        fields=[
+            {'name': 'Question'}, 
+            {'name': 'Answer'}
+        ],
+        templates=[
+            {
+                'name': 'Card 1',
+                'qfmt': '''
 <div class="question">{{Question}}</div>
 ''',
-                    'afmt': '''
+                'afmt': '''
 <div class="question">{{Question}}</div>
 <hr id="answer">
 <div class="answer">{{Answer}}</div>
 ''',
-                },
-            ],
-            css='''
+            },
+        ],
+        css='''
 .card {
     font-family: arial;
     font-size: 20px;
@@ -305,52 +388,350 @@ def process_pdf_to_anki(pdf_path: str, output_file: str, deck_name: str, model:
 .MathJax {
     font-size: 115%;
 }
+.formula-inline {
+    vertical-align: middle;
+}
+.formula-display {
+    display: block;
+    margin: 10px auto;
+}
 ''')
 
-        anki_deck = genanki.Deck(
-            deck_id=generate_unique_id(deck_name), # Unique ID for the deck
-            name=deck_name
-        )
-
-        click.echo(f"Generating flashcards using Openrouter model: {model}...")
-        total_cards_generated = 0
-        skipped_chunks = 0
-        failed_chunks = 0
+class _SpooledNotes:
+    """Re-iterable view of a CardStore that yields genanki Notes one at a time.
+    genanki iterates `Deck.notes` while writing the package, so using this instead of a
+    list streams the notes from disk rather than holding all of them in memory."""
+
+    def __init__(self, store: CardStore, anki_card_model, formula_images: dict[MathSpan, str] | None = None):
+        self._store = store
+        self._anki_card_model = anki_card_model
+        self._formula_images = formula_images
+
+    def __iter__(self):
+        import genanki
+        from pdf_to_anki_flashcard_generator.formulas import replace_math_with_images
+
+        for question, answer in self._store.iter_cards():
+            if self._formula_images:
+                question = replace_math_with_images(question, self._formula_images)
+                answer = replace_math_with_images(answer, self._formula_images)
+            yield genanki.Note(model=self._anki_card_model, fields=[question, answer])
+
+def _report_invalid_formulas(cards: list[tuple[str, str]]) -> int:
+    """Validates the formulas of freshly generated cards, warns about invalid ones and returns their count."""
+    from pdf_to_anki_flashcard_generator.formulas import validate_math
+
+    invalid_cards = 0
+    for question, answer in cards:
+        errors = validate_math(question) + validate_math(answer)
+        if errors:
+            invalid_cards += 1
+            click.echo(f"Warning: invalid formula in card '{question[:60]}': {'; '.join(errors)}", err=True)
+    return invalid_cards
+
+def _require_formula_renderer() -> None:
+    if importlib.util.find_spec("matplotlib") is None:
+        raise click.ClickException("PNG formula rendering requires matplotlib (poetry install -E formula-png).")
+
+def render_formula_images(store: CardStore) -> dict[MathSpan, str]:
+    """Renders PNG images for all formulas in a CardStore (PRD F4), reusing the formula cache.
+    Returns the image path of every formula that could be rendered."""
+    from pdf_to_anki_flashcard_generator.formulas import DEFAULT_FORMULA_CACHE_DIR, extract_math_spans, render_formula_pngs
+
+    _require_formula_renderer()
+    spans = (span for question, answer in store.iter_cards() for span in extract_math_spans(question) + extract_math_spans(answer))
+    cache_dir = os.getenv("ANKICARDGEN_FORMULA_CACHE", DEFAULT_FORMULA_CACHE_DIR)
+    images, errors = render_formula_pngs(spans, cache_dir)
+    for span, error in errors.items():
+        click.echo(f"Warning: could not render formula '{span.tex}', keeping it for MathJax: {error}", err=True)
+    click.echo(f"Rendered PNG images for {len(images)} unique formulas.")
+    return images
+
+def _card_text(question: str, answer: str) -> str:
+    return f"Q: {question}\nA: {answer}"
+
+def _related_context(index: VectorIndex, chunk_vector: np.ndarray, context_k: int) -> list[str]:
+    """Returns up to `context_k` snippets of indexed chunks related to a chunk (earlier
+    sections of the same PDF or chunks of other decks)."""
+    if context_k <= 0:
+        return []
+    results = index.search(chunk_vector, context_k + 1, kind="chunk")[0]
+    # Skip (near-)identical chunks, e.g. when the same PDF is processed again
+    return [result.text[:CONTEXT_SNIPPET_CHARS] for result in results if result.score < 0.95][:context_k]
+
+def _drop_near_duplicate_cards(index: VectorIndex, cards: list[tuple[str, str]], threshold: float, source: str) -> tuple[list[tuple[str, str]], np.ndarray]:
+    """Drops cards whose cosine similarity to an indexed card of another source PDF, or to
+    another card of the same batch, reaches `threshold`. Cards indexed from `source` itself
+    are ignored, so processing a PDF again does not drop all of its cards.
+    Returns the remaining cards and their vectors."""
+    vectors = index.vectorizer.transform([_card_text(question, answer) for question, answer in cards])
+    nearest = index.search(vectors, 1, kind="card", exclude_source=source)
+    keep = []
+    for i, results in enumerate(nearest):
+        if results and results[0].score >= threshold:
+            continue
+        if any(float(vectors[i] @ vectors[j]) >= threshold for j in keep):
+            continue
+        keep.append(i)
+    return [cards[i] for i in keep], vectors[keep]
+
+def write_deck_from_store(store: CardStore, output_file: str, deck_name: str, anki_model_name: str, formula_images: dict[MathSpan, str] | None = None) -> str:
+    """Builds an .apkg Anki deck by streaming the cards of a CardStore.
+    If `formula_images` is given, the rendered formulas are replaced by their PNGs, which
+    are embedded as media files. Returns the path of the written deck."""
+    import genanki
+
+    anki_deck = genanki.Deck(
+        deck_id=generate_unique_id(deck_name), # Unique ID for the deck
+        name=deck_name
+    )
+    anki_deck.notes = _SpooledNotes(store, _create_anki_card_model(anki_model_name), formula_images)
+
+    genanki_package = genanki.Package(anki_deck, media_files=sorted(set(formula_images.values())) if formula_images else None)
+    # Ensure output file has .apkg extension
+    if not output_file.lower().endswith(".apkg"):
+        output_file += ".apkg"
         
-        for i, chunk in enumerate(chunks):
-            click.echo(f"Processing chunk {i+1}/{len(chunks)}...", nl=False)
-            cards = _generate_multiple_qna_from_chunk_via_llm(client, chunk, model, anki_model_name)
-            
-            if cards:
-                click.echo(f" Generated {len(cards)} cards.")
-                for j, (question, answer) in enumerate(cards):
-                    note = genanki.Note(model=anki_card_model, fields=[question, answer])
-                    anki_deck.add_note(note)
-                total_cards_generated += len(cards)
+    genanki_package.write_to_file(output_file)
+    return output_file
+
+def generate_anki_deck(client: OpenAI, pdf_path: str, output_file: str | None, deck_name: str, model: str, max_chars_per_chunk: int, anki_model_name: str, card_store_path: str | None = None, formula_png: bool = False, index_dir: str | None = None, context_k: int = 3, dedup_threshold: float | None = None, cost_tracker: CostTracker | None = None, stats: dict | None = None, chunks: list[str] | None = None) -> str | None:
+    """Extracts the text of a PDF, generates Q/A flashcards via LLM and writes an .apkg Anki deck.
+    Generated cards are spooled to a CardStore at `card_store_path` (a temporary file if None)
+    as they are produced, so memory use stays constant regardless of the number of cards.
+    With `formula_png`, formulas are replaced by embedded PNG images.
+    With `index_dir`, chunks and cards are added to the local vector index; the `context_k`
+    most related indexed chunks are passed to the LLM as context. If `dedup_threshold` is
+    given, cards that are near-duplicates of indexed cards from other PDFs (cosine
+    similarity >= `dedup_threshold`) are dropped.
+    With a `cost_tracker` that has a budget, the run stops before a request that would
+    exceed it; the card store is then kept as a checkpoint and passing it again as
+    `card_store_path` resumes the run at the next chunk. The token usage is saved in the
+    card store, so the budget covers all runs of a checkpoint together.
+    If `stats` is given, it is updated with the number of generated `cards` and of
+    `skipped_chunks` and `failed_chunks` (chunks whose LLM request failed).
+    `chunks` may be passed if the PDF was already extracted, e.g. in a process pool.
+    With `output_file=None` only the card store at `card_store_path` is filled, e.g. to
+    cache the cards and build decks from them later with `write_deck_from_store`.
+    Returns the path of the written deck (or of the card store), or None if no flashcards
+    were generated."""
+    from pdf_to_anki_flashcard_generator.budget import TokenCounter
+    from pdf_to_anki_flashcard_generator.card_store import CardStore
+    from pdf_to_anki_flashcard_generator.vector_index import VectorIndex
+
+    if output_file is None and card_store_path is None:
+        raise ValueError("Either output_file or card_store_path is required.")
+
+    if formula_png:
+        # Fail before spending any LLM calls
+        _require_formula_renderer()
+
+    click.echo(f"Processing {pdf_path} to create Anki deck '{deck_name}'...")
+
+    if chunks is None:
+        extracted_text = extract_pdf_text(pdf_path)
+
+        if not extracted_text.strip():
+            click.echo(f"No text found in {pdf_path}.")
+            return None
+
+        chunks = segment_text_to_chunks(extracted_text, max_chars_per_chunk)
+    if not chunks:
+        click.echo("No text chunks could be generated.")
+        return None
+    
+    click.echo(f"Segmented PDF into {len(chunks)} chunks.")
+
+    keep_card_store = card_store_path is not None
+    if card_store_path is None:
+        fd, card_store_path = tempfile.mkstemp(prefix="ankicardgen_cards_", suffix=".sqlite")
+        os.close(fd)
+
+    index_source = os.path.abspath(pdf_path)
+    token_counter = TokenCounter(model) if cost_tracker is not None and cost_tracker.budget is not None else None
+    budget_exhausted = False
+
+    try:
+        with CardStore(card_store_path) as store, (VectorIndex(index_dir) if index_dir else contextlib.nullcontext()) as index:
+            total_cards_generated = 0
+            skipped_chunks = 0
+            failed_chunks = 0
+            invalid_formula_cards = 0
+            duplicate_cards = 0
+
+            # Resume a checkpointed run of the same PDF with the same chunking
+            start_chunk = 0
+            # Token usage (prompt, completion, requests) of the earlier runs of this store
+            stored_usage = (0, 0, 0)
+            source = f"{os.path.abspath(pdf_path)}|{max_chars_per_chunk}"
+            if store.get_meta("source") == source:
+                start_chunk = int(store.get_meta("next_chunk") or 0)
+                total_cards_generated = len(store)
+                stored_usage = tuple(int(store.get_meta(key) or 0) for key in ("prompt_tokens", "completion_tokens", "requests"))
+                if cost_tracker is not None:
+                    cost_tracker.add(*stored_usage)
+                if start_chunk >= len(chunks):
+                    click.echo(f"All chunks were already processed, building the deck from the {total_cards_generated} cards in {card_store_path}.")
+                elif start_chunk:
+                    click.echo(f"Resuming at chunk {start_chunk + 1}/{len(chunks)} with {total_cards_generated} cards from {card_store_path}.")
+            elif len(store):
+                raise click.ClickException(f"The card store {card_store_path} already contains cards of another PDF or chunk size. Use a different --card-store.")
             else:
-                # Entweder wurde der Chunk übersprungen (wird bereits in _parse_multiple_qna_from_llm_response ausgegeben)
-                # oder es gab einen technischen Fehler
-                if " Skipping: " not in str(click.get_text_stream('stdout')):
+                store.set_meta("source", source)
+            if index is not None and start_chunk == 0:
+                # Replace the entries of earlier runs, so they do not crowd out context and search results
+                index.remove_source(index_source)
+            if cost_tracker is not None:
+                # The tracker may also hold the usage of other files of a batch
+                usage_offset = (cost_tracker.prompt_tokens - stored_usage[0],
+                                cost_tracker.completion_tokens - stored_usage[1],
+                                cost_tracker.requests - stored_usage[2])
+
+            click.echo(f"Generating flashcards using Openrouter model: {model}...")
+            
+            for i, chunk in enumerate(chunks):
+                if i < start_chunk:
+                    continue
+                context_snippets = None
+                if index is not None:
+                    chunk_vector = index.vectorizer.transform([chunk])
+                    context_snippets = _related_context(index, chunk_vector, context_k)
+
+                if token_counter is not None:
+                    prompt_tokens = token_counter.count_messages(_build_qna_messages(chunk, context_snippets))
+                    if not cost_tracker.can_afford(prompt_tokens, cost_tracker.expected_completion_tokens()):
+                        click.echo(f"Budget of ${cost_tracker.budget:.2f} reached (spent ${cost_tracker.cost:.4f}). Stopping before chunk {i+1}/{len(chunks)}.")
+                        cost_tracker.exhausted = True
+                        budget_exhausted = True
+                        break
+
+                click.echo(f"Processing chunk {i+1}/{len(chunks)}...", nl=False)
+                cards = _generate_multiple_qna_from_chunk_via_llm(client, chunk, model, anki_model_name, context_snippets, cost_tracker)
+                failed = cards is None
+                if failed:
+                    cards = []
+
+                duplicates = 0
+                if index is not None:
+                    if cards:
+                        if dedup_threshold is not None:
+                            unique_cards, card_vectors = _drop_near_duplicate_cards(index, cards, dedup_threshold, index_source)
+                            duplicates = len(cards) - len(unique_cards)
+                            cards = unique_cards
+                        else:
+                            card_vectors = index.vectorizer.transform([_card_text(question, answer) for question, answer in cards])
+                        index.add(card_vectors, "card", deck_name, [_card_text(question, answer) for question, answer in cards], index_source)
+                    index.add(chunk_vector, "chunk", deck_name, [chunk], index_source)
+                duplicate_cards += duplicates
+                
+                if cards:
+                    click.echo(f" Generated {len(cards)} cards." + (f" Skipped {duplicates} near-duplicates." if duplicates else ""))
+                    invalid_formula_cards += _report_invalid_formulas(cards)
+                    store.add_cards(i, cards)
+                    total_cards_generated += len(cards)
+                elif duplicates:
+                    click.echo(f" Skipped {duplicates} near-duplicate cards.")
+                elif failed:
                     click.echo(" Failed to generate any cards for this chunk.")
                     failed_chunks += 1
                 else:
+                    # Der Chunk wurde übersprungen (wird bereits in _parse_multiple_qna_from_llm_response ausgegeben)
                     skipped_chunks += 1
-        
-        if total_cards_generated == 0:
-            click.echo("No flashcards were successfully generated. No .apkg file will be created.")
-            return
-
-        genanki_package = genanki.Package(anki_deck)
-        # Ensure output file has .apkg extension
-        if not output_file.lower().endswith(".apkg"):
-            output_file += ".apkg"
+                progress = {"next_chunk": str(i + 1)}
+                if cost_tracker is not None:
+                    progress.update(
+                        prompt_tokens=str(cost_tracker.prompt_tokens - usage_offset[0]),
+                        completion_tokens=str(cost_tracker.completion_tokens - usage_offset[1]),
+                        requests=str(cost_tracker.requests - usage_offset[2]),
+                    )
+                store.update_meta(progress)
+
+            if stats is not None:
+                stats.update(cards=total_cards_generated, skipped_chunks=skipped_chunks, failed_chunks=failed_chunks)
+
+            if budget_exhausted:
+                # Keep the store as a checkpoint instead of writing an incomplete deck
+                return None
             
-        genanki_package.write_to_file(output_file)
-        click.echo(f"\nErfolgreiche Verarbeitung:")
-        click.echo(f"- {total_cards_generated} Karteikarten generiert")
-        click.echo(f"- {skipped_chunks} Chunks übersprungen (da nicht karteikartenwürdig)")
-        click.echo(f"- {failed_chunks} Chunks fehlgeschlagen (technische Fehler)")
+            if total_cards_generated == 0:
+                click.echo("No flashcards were successfully generated. No .apkg file will be created.")
+                return None
+
+            if output_file is not None:
+                formula_images = render_formula_images(store) if formula_png else None
+                output_file = write_deck_from_store(store, output_file, deck_name, anki_model_name, formula_images)
+    finally:
+        if budget_exhausted and not keep_card_store:
+            checkpoint_path = os.path.splitext(output_file)[0] + ".cards.sqlite"
+            shutil.move(card_store_path, checkpoint_path)
+            card_store_path = checkpoint_path
+        elif not keep_card_store and os.path.exists(card_store_path):
+            os.remove(card_store_path)
+        if budget_exhausted:
+            click.echo(f"Checkpoint saved to {os.path.abspath(card_store_path)}.")
+            click.echo("The budget covers all runs of a checkpoint together. Resume with a higher budget:")
+            output_option = f"--output-file {shlex.quote(output_file)} " if output_file is not None else ""
+            click.echo(f"  ankicardgen process-pdf-to-anki {shlex.quote(pdf_path)} --card-store {shlex.quote(card_store_path)} "
+                       f"{output_option}--deck-name {shlex.quote(deck_name)} "
+                       f"--model {shlex.quote(model)} --max-chars-per-chunk {max_chars_per_chunk} --budget <USD>")
+            click.echo("or export the cards so far with build-deck.")
+
+    click.echo(f"\nErfolgreiche Verarbeitung:")
+    click.echo(f"- {total_cards_generated} Karteikarten generiert")
+    click.echo(f"- {skipped_chunks} Chunks übersprungen (da nicht karteikartenwürdig)")
+    click.echo(f"- {failed_chunks} Chunks fehlgeschlagen (technische Fehler)")
+    click.echo(f"- {invalid_formula_cards} Karteikarten mit fehlerhaften Formeln")
+    if index_dir and dedup_threshold is not None:
+        click.echo(f"- {duplicate_cards} Karteikarten als Beinahe-Duplikate übersprungen")
+    if output_file is not None:
         click.echo(f"- Anki-Deck '{deck_name}' gespeichert: {os.path.abspath(output_file)}")
+    if keep_card_store:
+        click.echo(f"- Karten-Speicher: {os.path.abspath(card_store_path)}")
+    if cost_tracker is not None and cost_tracker.requests:
+        cost_info = f", ${cost_tracker.cost:.4f}" if cost_tracker.cost is not None else ""
+        click.echo(f"- Token-Verbrauch bisher: {cost_tracker.prompt_tokens} Prompt + {cost_tracker.completion_tokens} Completion{cost_info}")
+    return output_file if output_file is not None else card_store_path
+
+
+def _create_cost_tracker(model: str, budget: float | None, price_prompt: float | None, price_completion: float | None) -> CostTracker:
+    from pdf_to_anki_flashcard_generator.budget import CostTracker, resolve_pricing
+
+    pricing = resolve_pricing(model, price_prompt, price_completion)
+    if budget is not None and pricing is None:
+        raise click.ClickException(f"Unknown price for model '{model}'. Pass --price-prompt and --price-completion to use --budget.")
+    return CostTracker(pricing, budget)
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+@cli.command(name="process-pdf-to-anki")
+@click.argument('pdf_path', type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option('--output-file', default="output_deck.apkg", show_default=True, help='Name of the generated .apkg file.')
+@click.option('--deck-name', default="Generated Anki Deck", show_default=True, help='Name of the Anki deck.')
+@click.option('--model', default=os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo"), show_default=True, help="The Openrouter model for card generation.")
+@click.option('--max-chars-per-chunk', default=1800, show_default=True, help='Maximum characters per text chunk for LLM processing.')
+@click.option('--anki-model-name', default='Basic (Simple Q&A)', show_default=True, help='Name for the Anki card model to be created.')
+@click.option('--card-store', default=None, type=click.Path(dir_okay=False), help='Keep the generated cards in this SQLite file (e.g. for review or a later build-deck).')
+@click.option('--formula-png', is_flag=True, help='Replace the formulas with embedded PNG renderings for Anki clients without MathJax; only formulas that cannot be rendered stay MathJax (requires matplotlib).')
+@click.option('--index-dir', default=DEFAULT_INDEX_DIR, show_default=True, type=click.Path(file_okay=False), help='Directory of the local vector index used for context retrieval and duplicate checks.')
+@click.option('--no-index', is_flag=True, help='Do not use or update the local vector index.')
+@click.option('--context-k', default=3, show_default=True, help='Number of related indexed chunks passed to the LLM as context.')
+@click.option('--dedup-threshold', type=float, default=None, help='Drop cards whose cosine similarity to an indexed card of another PDF reaches this value (e.g. 0.9). Off by default.')
+@click.option('--budget', type=float, default=None, help='Maximum spend in USD. The run stops and saves a checkpoint before a request would exceed it.')
+@click.option('--price-prompt', type=float, default=None, envvar='ANKICARDGEN_PRICE_PROMPT', help='Price in USD per million prompt tokens (overrides the built-in table).')
+@click.option('--price-completion', type=float, default=None, envvar='ANKICARDGEN_PRICE_COMPLETION', help='Price in USD per million completion tokens (overrides the built-in table).')
+def process_pdf_to_anki(pdf_path: str, output_file: str, deck_name: str, model: str, max_chars_per_chunk: int, anki_model_name: str, card_store: str | None, formula_png: bool, index_dir: str, no_index: bool, context_k: int, dedup_threshold: float | None, budget: float | None, price_prompt: float | None, price_completion: float | None):
+    """Processes a PDF, generates Q/A flashcards via LLM, and creates an .apkg Anki deck.
+
+    PDF_PATH: The path to the PDF file to process.
+    """
+    try:
+        client = get_openrouter_client()
+        cost_tracker = _create_cost_tracker(model, budget, price_prompt, price_completion)
+        generate_anki_deck(client, pdf_path, output_file, deck_name, model, max_chars_per_chunk, anki_model_name, card_store, formula_png,
+                           None if no_index else index_dir, context_k, dedup_threshold, cost_tracker)
 
     except click.ClickException as e: 
         click.echo(f"Error: {e}", err=True)
@@ -359,6 +740,155 @@ def process_pdf_to_anki(pdf_path: str, output_file: str, deck_name: str, model:
         import traceback
         click.echo(traceback.format_exc(), err=True)
 
+@cli.command(name="batch")
+@click.argument('pdf_paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option('--output-dir', default=".", show_default=True, type=click.Path(file_okay=False), help='Directory for the generated .apkg files.')
+@click.option('--model', default=os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo"), show_default=True, help="The Openrouter model for card generation.")
+@click.option('--max-chars-per-chunk', default=1800, show_default=True, help='Maximum characters per text chunk for LLM processing.')
+@click.option('--anki-model-name', default='Basic (Simple Q&A)', show_default=True, help='Name for the Anki card model to be created.')
+@click.option('--formula-png', is_flag=True, help='Replace the formulas with embedded PNG renderings for Anki clients without MathJax; only formulas that cannot be rendered stay MathJax (requires matplotlib).')
+@click.option('--index-dir', default=DEFAULT_INDEX_DIR, show_default=True, type=click.Path(file_okay=False), help='Directory of the local vector index used for context retrieval and duplicate checks.')
+@click.option('--no-index', is_flag=True, help='Do not use or update the local vector index.')
+@click.option('--context-k', default=3, show_default=True, help='Number of related indexed chunks passed to the LLM as context.')
+@click.option('--dedup-threshold', type=float, default=None, help='Drop cards whose cosine similarity to an indexed card of another PDF reaches this value (e.g. 0.9). Off by default.')
+@click.option('--budget', type=float, default=None, help='Maximum spend in USD. The run stops and saves a checkpoint before a request would exceed it.')
+@click.option('--price-prompt', type=float, default=None, envvar='ANKICARDGEN_PRICE_PROMPT', help='Price in USD per million prompt tokens (overrides the built-in table).')
+@click.option('--price-completion', type=float, default=None, envvar='ANKICARDGEN_PRICE_COMPLETION', help='Price in USD per million completion tokens (overrides the built-in table).')
+def batch(pdf_paths: tuple[str, ...], output_dir: str, model: str, max_chars_per_chunk: int, anki_model_name: str, formula_png: bool, index_dir: str, no_index: bool, context_k: int, dedup_threshold: float | None, budget: float | None, price_prompt: float | None, price_completion: float | None):
+    """Processes several PDFs in one run, creating one .apkg deck per PDF.
+
+    All files share a single Openrouter client, so pooled connections are reused
+    instead of paying new TCP/TLS handshakes per file. --budget applies to the whole batch.
+
+    PDF_PATHS: The paths of the PDF files to process.
+    """
+    try:
+        client = get_openrouter_client()
+        cost_tracker = _create_cost_tracker(model, budget, price_prompt, price_completion)
+    except click.ClickException as e:
+        click.echo(f"Error: {e}", err=True)
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    for n, pdf_path in enumerate(pdf_paths, 1):
+        deck_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        output_file = os.path.join(output_dir, f"{deck_name}.apkg")
+        try:
+            generate_anki_deck(client, pdf_path, output_file, deck_name, model, max_chars_per_chunk, anki_model_name, formula_png=formula_png,
+                               index_dir=None if no_index else index_dir, context_k=context_k, dedup_threshold=dedup_threshold,
+                               cost_tracker=cost_tracker)
+        except click.ClickException as e: 
+            click.echo(f"Error: {e}", err=True)
+        except Exception as e:
+            click.echo(f"An unexpected error occurred: {e}", err=True)
+            import traceback
+            click.echo(traceback.format_exc(), err=True)
+        if cost_tracker.exhausted:
+            click.echo(f"Budget exhausted, {len(pdf_paths) - n} remaining PDFs were not processed.")
+            break
+
+@cli.command()
+@click.argument('pdf_paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option('--model', default=os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo"), show_default=True, help="The Openrouter model for card generation.")
+@click.option('--max-chars-per-chunk', default=1800, show_default=True, help='Maximum characters per text chunk for LLM processing.')
+@click.option('--context-k', default=3, show_default=True, help='Number of related chunks passed as context per request (0 for --no-index runs).')
+@click.option('--concurrency', default=1, show_default=True, help='Parallel LLM requests assumed for the wall time (the CLI sends one at a time, the ASGI web API up to ASGI_LLM_CONCURRENCY).')
+@click.option('--seconds-per-request', default=10.0, show_default=True, help='Assumed average LLM latency per request.')
+@click.option('--expected-completion-tokens', default=None, type=int, help='Assumed completion tokens per request.  [default: 600]')
+@click.option('--budget', type=float, default=None, help='Warn if the forecast exceeds this spend in USD.')
+@click.option('--price-prompt', type=float, default=None, envvar='ANKICARDGEN_PRICE_PROMPT', help='Price in USD per million prompt tokens (overrides the built-in table).')
+@click.option('--price-completion', type=float, default=None, envvar='ANKICARDGEN_PRICE_COMPLETION', help='Price in USD per million completion tokens (overrides the built-in table).')
+def estimate(pdf_paths: tuple[str, ...], model: str, max_chars_per_chunk: int, context_k: int, concurrency: int, seconds_per_request: float, expected_completion_tokens: int | None, budget: float | None, price_prompt: float | None, price_completion: float | None):
+    """Forecasts tokens, cost and wall time of processing PDFs without calling the LLM.
+
+    Every chunk and the fixed prompt are tokenised locally (with tiktoken if installed).
+    As context, each chunk is assumed to get up to --context-k preceding chunks.
+
+    PDF_PATHS: The paths of the PDF files to estimate.
+    """
+    from pdf_to_anki_flashcard_generator.budget import DEFAULT_EXPECTED_COMPLETION_TOKENS, TokenCounter, cost, resolve_pricing
+
+    if expected_completion_tokens is None:
+        expected_completion_tokens = DEFAULT_EXPECTED_COMPLETION_TOKENS
+    pricing = resolve_pricing(model, price_prompt, price_completion)
+    token_counter = TokenCounter(model)
+    fixed_prompt_tokens = token_counter.count_messages(_build_qna_messages(""))
+
+    total_requests = 0
+    total_prompt_tokens = 0
+    for pdf_path in pdf_paths:
+        chunks = extract_chunks(pdf_path, max_chars_per_chunk)
+        prompt_tokens = 0
+        for i, chunk in enumerate(chunks):
+            # Stand-in for retrieved context: the preceding chunks, cut like real snippets
+            context_snippets = [previous[:CONTEXT_SNIPPET_CHARS] for previous in chunks[max(0, i - context_k):i]]
+            prompt_tokens += token_counter.count_messages(_build_qna_messages(chunk, context_snippets))
+        click.echo(f"{pdf_path}: {len(chunks)} chunks, {prompt_tokens} prompt tokens")
+        total_requests += len(chunks)
+        total_prompt_tokens += prompt_tokens
+
+    total_completion_tokens = total_requests * expected_completion_tokens
+    click.echo(f"\nSchätzung für {model} (Tokenizer: {token_counter.method}):")
+    click.echo(f"- {total_requests} Anfragen (fester Prompt: {fixed_prompt_tokens} Tokens pro Anfrage)")
+    click.echo(f"- {total_prompt_tokens} Prompt-Tokens + ca. {total_completion_tokens} Completion-Tokens = {total_prompt_tokens + total_completion_tokens} Tokens")
+    if pricing is None:
+        click.echo(f"- Kosten: unbekannt (kein Preis für '{model}' hinterlegt, siehe --price-prompt/--price-completion)")
+    else:
+        total_cost = cost(pricing, total_prompt_tokens, total_completion_tokens)
+        click.echo(f"- Kosten: ca. ${total_cost:.4f} (${pricing.prompt}/${pricing.completion} pro 1M Prompt-/Completion-Tokens)")
+        if budget is not None and total_cost > budget:
+            click.echo(f"Warning: the forecast exceeds the budget of ${budget:.2f}.", err=True)
+    wall_time = math.ceil(total_requests / max(concurrency, 1)) * seconds_per_request
+    click.echo(f"- Laufzeit: ca. {_format_duration(wall_time)} bei {concurrency} parallelen Anfragen")
+
+@cli.command(name="build-deck")
+@click.argument('card_store', type=click.Path(exists=True, dir_okay=False, readable=True))
+@click.option('--output-file', default="output_deck.apkg", show_default=True, help='Name of the generated .apkg file.')
+@click.option('--deck-name', default="Generated Anki Deck", show_default=True, help='Name of the Anki deck.')
+@click.option('--anki-model-name', default='Basic (Simple Q&A)', show_default=True, help='Name for the Anki card model to be created.')
+@click.option('--formula-png', is_flag=True, help='Replace the formulas with embedded PNG renderings for Anki clients without MathJax; only formulas that cannot be rendered stay MathJax (requires matplotlib).')
+def build_deck(card_store: str, output_file: str, deck_name: str, anki_model_name: str, formula_png: bool):
+    """Builds an .apkg Anki deck from a card store written with --card-store.
+
+    CARD_STORE: The path to the SQLite card store.
+    """
+    from pdf_to_anki_flashcard_generator.card_store import CardStore
+
+    with CardStore(card_store) as store:
+        card_count = len(store)
+        if card_count == 0:
+            click.echo("The card store is empty. No .apkg file will be created.")
+            return
+        formula_images = render_formula_images(store) if formula_png else None
+        output_file = write_deck_from_store(store, output_file, deck_name, anki_model_name, formula_images)
+    click.echo(f"Anki-Deck '{deck_name}' mit {card_count} Karteikarten gespeichert: {os.path.abspath(output_file)}")
+
+@cli.command()
+@click.argument('query')
+@click.option('--top-k', default=10, show_default=True, help='Number of results to show.')
+@click.option('--kind', type=click.Choice(['card', 'chunk', 'all']), default='card', show_default=True, help='Search generated cards, source text chunks, or both.')
+@click.option('--index-dir', default=DEFAULT_INDEX_DIR, show_default=True, type=click.Path(file_okay=False), help='Directory of the local vector index.')
+def search(query: str, top_k: int, kind: str, index_dir: str):
+    """Searches the cards and text chunks of all previously generated decks.
+
+    QUERY: The text to search for.
+    """
+    from pdf_to_anki_flashcard_generator.vector_index import VectorIndex
+
+    if not os.path.isdir(index_dir):
+        raise click.ClickException(f"No index found in {index_dir}.")
+
+    with VectorIndex(index_dir) as index:
+        results = index.search(index.vectorizer.transform([query]), top_k, kind=None if kind == 'all' else kind)[0]
+
+    if not results:
+        click.echo("No results.")
+        return
+    for result in results:
+        click.echo(f"[{result.score:.3f}] {result.deck} ({result.kind})")
+        click.echo("    " + result.text.replace("\n", "\n    "))
+        click.echo()
+
 
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
@@ -0,0 +1,240 @@
+"""Local vector index over text chunks and generated cards.
+
+Texts are embedded with a hashed character n-gram vectoriser (CPU-only, no model
+download). Vectors are appended to a flat float32 file that is memory-mapped for search,
+so opening the index costs the same no matter how many decks it covers; metadata lives in
+SQLite and is only read for search hits. Writes are serialised through an SQLite write
+transaction, so several processes can share one index.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import zlib
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+KIND_CHUNK = "chunk"
+KIND_CARD = "card"
+_KIND_CODES = {KIND_CHUNK: 0, KIND_CARD: 1}
+# Kind code of removed entries; their vectors stay in place so ids remain stable
+_DELETED_CODE = 255
+
+DEFAULT_DIM = 1024
+
+class HashingVectorizer:
+    """Embeds texts as L2-normalised signed feature-hashing vectors of words and
+    character n-grams (within word boundaries), with sublinear term frequencies."""
+
+    def __init__(self, dim: int = DEFAULT_DIM, ngram_range: tuple[int, int] = (3, 5)):
+        if dim & (dim - 1):
+            raise ValueError("dim must be a power of two")
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        min_n, max_n = self.ngram_range
+        for word in re.findall(r'\w+', text.lower()):
+            features[word] += 1
+            padded = f" {word} "
+            for n in range(min_n, max_n + 1):
+                for i in range(len(padded) - n + 1):
+                    features["#" + padded[i:i + n]] += 1
+        return features
+
+    def transform(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h & (self.dim - 1)] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+class SearchResult(NamedTuple):
+    score: float
+    kind: str
+    deck: str
+    text: str
+    source: str
+
+class VectorIndex:
+    """Append-only, memory-mapped vector index with batched cosine search."""
+
+    def __init__(self, directory: str, dim: int = DEFAULT_DIM, block_size: int = 65536):
+        os.makedirs(directory, exist_ok=True)
+        self.block_size = block_size
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._kinds_path = os.path.join(directory, "kinds.u8")
+        meta_path = os.path.join(directory, "index.json")
+
+        if not os.path.exists(meta_path):
+            # Publish the complete file atomically; if another process was first, its settings win
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".json.tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"dim": dim, "vectorizer": "hashing-char-ngrams-v1"}, f)
+                os.link(tmp_path, meta_path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+        with open(meta_path, encoding="utf-8") as f:
+            dim = json.load(f)["dim"]
+        self.vectorizer = HashingVectorizer(dim)
+        self.dim = dim
+
+        # Generous timeout: concurrent writers wait for each other in `add`
+        self._conn = sqlite3.connect(os.path.join(directory, "items.sqlite"), timeout=60)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                deck TEXT NOT NULL,
+                text TEXT NOT NULL,
+                source TEXT NOT NULL DEFAULT ''
+            )"""
+        )
+        # Indexes created before sources were recorded
+        if "source" not in {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}:
+            try:
+                self._conn.execute("ALTER TABLE items ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+            except sqlite3.OperationalError:
+                # Added by another process in the meantime
+                pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS items_source ON items (source)")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * 4)
+
+    def add(self, vectors: np.ndarray, kind: str, deck: str, texts: list[str], source: str = "") -> None:
+        """Appends vectors (as returned by `self.vectorizer.transform`) and their texts.
+        `source` identifies the document the texts come from (see `search`)."""
+        if len(vectors) == 0:
+            return
+        # The write transaction locks the database, so other processes cannot append
+        # until the vectors and their items are committed together
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            start = self._conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM items").fetchone()[0]
+            # Drop vectors left behind by a writer that died before committing its items
+            if len(self) > start:
+                os.truncate(self._vectors_path, start * self.dim * 4)
+            if os.path.exists(self._kinds_path) and os.path.getsize(self._kinds_path) > start:
+                os.truncate(self._kinds_path, start)
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self._kinds_path, "ab") as f:
+                f.write(bytes([_KIND_CODES[kind]]) * len(vectors))
+            self._conn.executemany(
+                "INSERT INTO items (id, kind, deck, text, source) VALUES (?, ?, ?, ?, ?)",
+                [(start + i, kind, deck, text, source) for i, text in enumerate(texts)],
+            )
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+
+    def remove_source(self, source: str) -> int:
+        """Removes all entries added with `source`, e.g. before a PDF is indexed again.
+        Returns the number of removed entries."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [item_id for item_id, in self._conn.execute("SELECT id FROM items WHERE source = ? AND kind != 'deleted'", (source,))]
+            if ids:
+                kinds = np.memmap(self._kinds_path, dtype=np.uint8, mode="r+", shape=(max(ids) + 1,))
+                kinds[ids] = _DELETED_CODE
+                kinds.flush()
+                del kinds
+                self._conn.execute("UPDATE items SET kind = 'deleted', text = '' WHERE source = ?", (source,))
+            self._conn.commit()
+        except BaseException:
+            self._conn.rollback()
+            raise
+        return len(ids)
+
+    def search(self, queries: np.ndarray, k: int, kind: str | None = None, exclude_source: str | None = None) -> list[list[SearchResult]]:
+        """Returns the `k` most similar entries for every query vector, best first.
+        Entries added with `exclude_source` as their source are skipped.
+        The vectors are scanned block by block through a memory map, so memory use is
+        bounded by `block_size` regardless of the index size."""
+        # Only committed entries; a concurrent writer may be appending beyond them
+        n = self._conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM items").fetchone()[0]
+        if n == 0 or k <= 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        kinds = np.memmap(self._kinds_path, dtype=np.uint8, mode="r", shape=(n,))
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        excluded_ids = None
+        if exclude_source is not None:
+            excluded_ids = np.fromiter(
+                (item_id for item_id, in self._conn.execute("SELECT id FROM items WHERE source = ?", (exclude_source,))),
+                dtype=np.int64,
+            )
+
+        for start in range(0, n, self.block_size):
+            block = vectors[start:start + self.block_size]
+            scores = queries @ block.T
+            if kind is not None:
+                scores[:, kinds[start:start + self.block_size] != _KIND_CODES[kind]] = -np.inf
+            else:
+                scores[:, kinds[start:start + self.block_size] == _DELETED_CODE] = -np.inf
+            block_ids = np.arange(start, start + len(block))
+            if excluded_ids is not None and len(excluded_ids):
+                scores[:, np.isin(block_ids, excluded_ids)] = -np.inf
+            ids = np.broadcast_to(block_ids, scores.shape)
+
+            # Merge this block's candidates with the best ones so far, keep the top k
+            scores = np.concatenate([best_scores, scores], axis=1)
+            ids = np.concatenate([best_ids, ids], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                ids = np.take_along_axis(ids, top, axis=1)
+            best_scores, best_ids = scores, ids
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+
+        hit_ids = {int(i) for i, s in zip(best_ids.ravel(), best_scores.ravel()) if np.isfinite(s)}
+        items = {}
+        if hit_ids:
+            placeholders = ",".join("?" * len(hit_ids))
+            for item_id, item_kind, deck, text, source in self._conn.execute(
+                f"SELECT id, kind, deck, text, source FROM items WHERE id IN ({placeholders})", list(hit_ids)
+            ):
+                items[item_id] = (item_kind, deck, text, source)
+
+        results = []
+        for row_scores, row_ids in zip(best_scores, best_ids):
+            results.append([
+                SearchResult(float(score), *items[int(item_id)])
+                for score, item_id in zip(row_scores, row_ids)
+                if np.isfinite(score) and int(item_id) in items
+            ])
+        return results
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "VectorIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from artifact_store import ArtifactStore, UncachedResult, UploadTooLargeError
+
+def _store(root, **kwargs) -> ArtifactStore:
+    options = dict(max_upload_bytes=1024, ttl_seconds=3600, max_total_bytes=10 * 1024, min_free_bytes=0, chunk_size=100)
+    options.update(kwargs)
+    return ArtifactStore(str(root), **options)
+
+def _write_deck(content: bytes):
+    def build(output_path: str) -> str:
+        with open(output_path, "wb") as f:
+            f.write(content)
+        return output_path
+    return build
+
+def test_save_upload_streams_and_hashes(tmp_path):
+    store = _store(tmp_path)
+    data = os.urandom(1000)
+    path, digest = store.save_upload(io.BytesIO(data))
+    assert digest == hashlib.sha256(data).hexdigest()
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+def test_save_upload_rejects_large_uploads(tmp_path):
+    store = _store(tmp_path)
+    with pytest.raises(UploadTooLargeError):
+        store.save_upload(io.BytesIO(os.urandom(1025)))
+    assert os.listdir(store.incoming_dir) == []
+
+def test_result_key_depends_on_params():
+    assert ArtifactStore.result_key("abc", "Deck", 1800) == ArtifactStore.result_key("abc", "Deck", 1800)
+    assert ArtifactStore.result_key("abc", "Deck", 1800) != ArtifactStore.result_key("abc", "Deck", 2000)
+
+def test_get_or_create_caches_result(tmp_path):
+    store = _store(tmp_path)
+    builds = []
+
+    def build(output_path: str) -> str:
+        builds.append(output_path)
+        return _write_deck(b"deck")(output_path)
+
+    first = store.get_or_create("key", build)
+    second = store.get_or_create("key", build)
+    assert first == second
+    assert len(builds) == 1
+    with open(first, "rb") as f:
+        assert f.read() == b"deck"
+
+def test_get_or_create_does_not_cache_none(tmp_path):
+    store = _store(tmp_path)
+    assert store.get_or_create("key", lambda output_path: None) is None
+    assert store.get_result("key") is None
+    assert os.listdir(store.results_dir) == []
+
+def test_get_or_create_builds_once_for_concurrent_callers(tmp_path):
+    store = _store(tmp_path)
+    started = threading.Event()
+    release = threading.Event()
+    builds = []
+
+    def build(output_path: str) -> str:
+        builds.append(output_path)
+        started.set()
+        release.wait(5)
+        return _write_deck(b"deck")(output_path)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_create("key", build))) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(builds) == 1
+    assert len(results) == 5 and len(set(results)) == 1
+
+def test_get_or_create_propagates_build_errors(tmp_path):
+    store = _store(tmp_path)
+
+    def build(output_path: str) -> str:
+        _write_deck(b"partial")(output_path)
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        store.get_or_create("key", build)
+    # The partial deck is removed and the next call builds again
+    assert os.listdir(store.results_dir) == []
+    assert store.get_or_create("key", _write_deck(b"deck")) is not None
+
+def test_expired_results_are_rebuilt(tmp_path):
+    store = _store(tmp_path, ttl_seconds=60)
+    path = store.get_or_create("key", _write_deck(b"old"))
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert store.get_result("key") is None
+    store.get_or_create("key", _write_deck(b"new"))
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+
+def test_cleanup_evicts_least_recently_used(tmp_path):
+    store = _store(tmp_path, max_total_bytes=2500)
+    paths = [store.get_or_create(f"key{i}", _write_deck(bytes(1000))) for i in range(3)]
+    now = time.time()
+    for age, path in zip((30, 20, 10), paths):
+        os.utime(path, (now - age, now - age))
+
+    store.cleanup()
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+def test_uncached_results_are_served_but_not_cached(tmp_path):
+    store = _store(tmp_path)
+    path = store.get_or_create("key", lambda output_path: UncachedResult(_write_deck(b"partial")(output_path)))
+
+    result_id = ArtifactStore.result_id(path)
+    assert result_id != "key" and len(result_id) == 64
+    assert store.get_result(result_id) == path
+    assert store.get_result("key") is None
+
+    # The next call builds again and caches the complete deck under the key
+    path = store.get_or_create("key", _write_deck(b"deck"))
+    assert ArtifactStore.result_id(path) == "key"
+
+def test_suffix_keeps_results_of_the_same_key_apart(tmp_path):
+    store = _store(tmp_path)
+    deck = store.get_or_create("key", _write_deck(b"deck"))
+    cards = store.get_or_create("key", _write_deck(b"cards"), suffix=".cards.sqlite")
+
+    assert cards.endswith("key.cards.sqlite") and ArtifactStore.result_id(cards) == "key"
+    assert store.get_result("key") == deck
+    assert store.get_result("key", suffix=".cards.sqlite") == cards
+    with open(cards, "rb") as f:
+        assert f.read() == b"cards"
+
+def test_cleanup_skips_partial_results_of_any_suffix(tmp_path):
+    store = _store(tmp_path, max_total_bytes=0)
+    partial = store._partial_path("key", ".cards.sqlite")
+    _write_deck(b"partial")(partial)
+    store.cleanup()
+    assert os.path.exists(partial)
+
+def _async_build(release: asyncio.Event, builds: list, content: bytes = b"deck"):
+    async def build(output_path: str) -> str:
+        builds.append(output_path)
+        await release.wait()
+        return _write_deck(content)(output_path)
+    return build
+
+def test_aget_or_create_builds_once_for_concurrent_callers(tmp_path):
+    store = _store(tmp_path)
+    builds = []
+
+    async def run():
+        release = asyncio.Event()
+        callers = [asyncio.create_task(store.aget_or_create("key", _async_build(release, builds))) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(run())
+    assert len(builds) == 1
+    assert len(set(results)) == 1 and results[0] == store.get_result("key")
+
+def test_aget_or_create_survives_cancelled_builder(tmp_path):
+    store = _store(tmp_path)
+    builds = []
+
+    async def run():
+        release = asyncio.Event()
+        builder = asyncio.create_task(store.aget_or_create("key", _async_build(release, builds)))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(store.aget_or_create("key", _async_build(release, builds)))
+        await asyncio.sleep(0)
+
+        # The first client disconnects; the other upload keeps waiting for the same build
+        builder.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await builder
+        return await waiter
+
+    path = asyncio.run(run())
+    assert len(builds) == 1
+    assert path == store.get_result("key")
+
+def test_aget_or_create_finishes_build_without_waiters(tmp_path):
+    store = _store(tmp_path)
+    builds = []
+
+    async def run():
+        release = asyncio.Event()
+        caller = asyncio.create_task(store.aget_or_create("key", _async_build(release, builds)))
+        await asyncio.sleep(0)
+        caller.cancel()
+        release.set()
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert store.get_result("key") is not None
+
+def test_aget_or_create_propagates_build_errors(tmp_path):
+    store = _store(tmp_path)
+
+    async def build(output_path: str) -> str:
+        raise RuntimeError("LLM down")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.aget_or_create("key", build))
+    assert os.listdir(store.results_dir) == []
@@ -0,0 +1,70 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("click")
+
+from pdf_to_anki_flashcard_generator import async_pipeline
+
+class FakeAsyncClient:
+    """Stands in for AsyncOpenAI and records how many requests were in flight at once."""
+
+    def __init__(self, response: str = "SKIP: nothing to learn", fail: bool = False):
+        self.response = response
+        self.fail = fail
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if self.fail:
+                raise TimeoutError("pool timeout")
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.response))])
+        finally:
+            self.in_flight -= 1
+
+@pytest.fixture
+def ten_chunks(monkeypatch):
+    monkeypatch.setattr(async_pipeline, "extract_chunks", lambda pdf_path, max_chars: [f"Abschnitt {i}" for i in range(10)])
+
+def _generate(client, **kwargs):
+    return async_pipeline.agenerate_anki_deck(client, "doc.pdf", "out.apkg", "Deck", "model", 1800, "Basic", **kwargs)
+
+def test_llm_semaphore_bounds_requests_across_jobs(ten_chunks):
+    client = FakeAsyncClient()
+
+    async def run():
+        llm_semaphore = asyncio.Semaphore(3)
+        await asyncio.gather(*(_generate(client, concurrency=8, llm_semaphore=llm_semaphore) for _ in range(4)))
+
+    asyncio.run(run())
+    assert client.max_in_flight == 3
+
+def test_failed_chunks_are_reported(ten_chunks):
+    stats = {}
+    events = []
+    assert asyncio.run(_generate(FakeAsyncClient(fail=True), stats=stats, on_progress=events.append)) is None
+    assert stats == {"cards": 0, "skipped_chunks": 0, "failed_chunks": 10}
+    assert events[-1]["failed"] == 10
+
+def test_skipped_chunks_are_not_failures(ten_chunks):
+    stats = {}
+    asyncio.run(_generate(FakeAsyncClient(), stats=stats))
+    assert stats == {"cards": 0, "skipped_chunks": 10, "failed_chunks": 0}
+
+def test_without_output_file_only_the_card_store_is_filled(ten_chunks, tmp_path):
+    from pdf_to_anki_flashcard_generator.card_store import CardStore
+
+    card_store_path = str(tmp_path / "cards.sqlite")
+    client = FakeAsyncClient(response="CARD 1:\nQ: Frage?\nA: Antwort.")
+    result = asyncio.run(async_pipeline.agenerate_anki_deck(client, "doc.pdf", None, "Deck", "model", 1800, "Basic",
+                                                            card_store_path=card_store_path))
+    assert result == card_store_path
+    with CardStore(card_store_path) as store:
+        assert len(store) == 10
+    assert not (tmp_path / "out.apkg").exists()
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pdf_to_anki_flashcard_generator.budget import (
+    DEFAULT_EXPECTED_COMPLETION_TOKENS,
+    CostTracker,
+    ModelPricing,
+    TokenCounter,
+    cost,
+    resolve_pricing,
+)
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+def test_resolve_pricing():
+    assert resolve_pricing("openai/gpt-4o-mini") == ModelPricing(0.15, 0.6)
+    assert resolve_pricing("openai/gpt-4o-mini", 1.0) == ModelPricing(1.0, 0.6)
+    assert resolve_pricing("unknown/model") is None
+    assert resolve_pricing("unknown/model", 1.0) is None
+    assert resolve_pricing("unknown/model", 1.0, 2.0) == ModelPricing(1.0, 2.0)
+
+def test_cost_is_per_million_tokens():
+    assert cost(ModelPricing(1.0, 2.0), 1_000_000, 500_000) == pytest.approx(2.0)
+
+def test_token_counter_counts_messages():
+    counter = TokenCounter("openai/gpt-4o-mini")
+    text = "Die Laufzeit von Quicksort beträgt im Mittel O(n log n)."
+    assert counter.count(text) > 0
+    messages = [{"role": "system", "content": text}, {"role": "user", "content": text}]
+    assert counter.count_messages(messages) > 2 * counter.count(text)
+
+def test_cost_tracker_records_usage():
+    tracker = CostTracker(ModelPricing(1.0, 2.0))
+    assert tracker.expected_completion_tokens() == DEFAULT_EXPECTED_COMPLETION_TOKENS
+    tracker.record(_usage(1000, 300))
+    tracker.record(_usage(1000, 500))
+    tracker.record(None)
+    assert (tracker.requests, tracker.prompt_tokens, tracker.completion_tokens) == (2, 2000, 800)
+    assert tracker.expected_completion_tokens() == 400
+    assert tracker.cost == pytest.approx((2000 * 1.0 + 800 * 2.0) / 1_000_000)
+
+def test_cost_tracker_budget():
+    tracker = CostTracker(ModelPricing(1.0, 1.0), budget=0.01)
+    assert tracker.can_afford(5000, 5000)
+    tracker.record(_usage(5000, 4000))
+    assert tracker.can_afford(500, 500)
+    assert not tracker.can_afford(1000, 1000)
+
+def test_cost_tracker_without_budget_or_price_never_stops():
+    assert CostTracker(ModelPricing(1.0, 1.0)).can_afford(10**9, 10**9)
+    tracker = CostTracker(None, budget=0.01)
+    tracker.record(_usage(10**9, 10**9))
+    assert tracker.cost is None
+    assert tracker.can_afford(10**9, 10**9)
@@ -0,0 +1,25 @@
+from pdf_to_anki_flashcard_generator.card_store import CardStore
+
+def test_iter_cards_in_document_order(tmp_path):
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        store.add_cards(2, [("Q3", "A3")])
+        store.add_cards(0, [("Q1", "A1"), ("Q2", "A2")])
+        store.add_cards(5, [])
+
+        assert len(store) == 3
+        assert list(store.iter_cards(batch_size=2)) == [("Q1", "A1"), ("Q2", "A2"), ("Q3", "A3")]
+
+def test_cards_persist_across_reopen(tmp_path):
+    path = str(tmp_path / "cards.sqlite")
+    with CardStore(path) as store:
+        store.add_cards(0, [("Q1", "A1")])
+    with CardStore(path) as store:
+        store.add_cards(1, [("Q2", "A2")])
+        assert list(store.iter_cards()) == [("Q1", "A1"), ("Q2", "A2")]
+
+def test_meta(tmp_path):
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        assert store.get_meta("next_chunk") is None
+        store.set_meta("next_chunk", "3")
+        store.set_meta("next_chunk", "4")
+        assert store.get_meta("next_chunk") == "4"
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("click")
+
+from pdf_to_anki_flashcard_generator.budget import CostTracker, ModelPricing
+from pdf_to_anki_flashcard_generator.card_store import CardStore
+from pdf_to_anki_flashcard_generator.main import generate_anki_deck
+
+CHUNKS = [f"Abschnitt {i}: Die Laufzeit von Quicksort beträgt O(n log n)." for i in range(10)]
+
+class FakeClient:
+    """Stands in for the OpenAI client; every request costs 1000 prompt + 1000 completion tokens."""
+
+    def __init__(self):
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests += 1
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="CARD 1:\nQ: Frage?\nA: Antwort."))],
+            usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=1000),
+        )
+
+def _run(tmp_path, client, budget):
+    # 1 USD per million tokens: every request costs 0.002 USD
+    tracker = CostTracker(ModelPricing(1.0, 1.0), budget)
+    result = generate_anki_deck(client, str(tmp_path / "skript.pdf"), str(tmp_path / "skript.apkg"), "Skript", "model", 1800, "Basic",
+                                card_store_path=str(tmp_path / "cards.sqlite"), cost_tracker=tracker, chunks=CHUNKS)
+    return result, tracker
+
+def test_budget_stops_and_saves_usage(tmp_path):
+    client = FakeClient()
+    result, tracker = _run(tmp_path, client, budget=0.0061)
+
+    assert result is None and tracker.exhausted
+    assert client.requests == 3
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        assert len(store) == 3
+        assert store.get_meta("next_chunk") == "3"
+        assert (store.get_meta("prompt_tokens"), store.get_meta("completion_tokens"), store.get_meta("requests")) == ("3000", "3000", "3")
+
+def test_resume_counts_spend_of_earlier_runs(tmp_path):
+    _run(tmp_path, FakeClient(), budget=0.0061)
+
+    # The same budget is already spent: resuming sends no further requests
+    client = FakeClient()
+    result, tracker = _run(tmp_path, client, budget=0.0061)
+    assert result is None and client.requests == 0
+    assert tracker.cost == pytest.approx(0.006)
+
+    # A higher budget continues at the next chunk
+    client = FakeClient()
+    _, tracker = _run(tmp_path, client, budget=0.0101)
+    assert client.requests == 2
+    assert tracker.requests == 5
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        assert store.get_meta("next_chunk") == "5"
+        assert store.get_meta("requests") == "5"
+
+def test_card_store_of_another_pdf_is_rejected(tmp_path):
+    import click
+
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        store.set_meta("source", "/other.pdf|1800")
+        store.add_cards(0, [("Fremde Frage?", "Fremde Antwort.")])
+
+    client = FakeClient()
+    with pytest.raises(click.ClickException):
+        _run(tmp_path, client, budget=None)
+    assert client.requests == 0
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        assert len(store) == 1
+        assert store.get_meta("source") == "/other.pdf|1800"
+
+def test_finished_card_store_is_rebuilt_without_requests(tmp_path):
+    _, tracker = _run(tmp_path, FakeClient(), budget=None)
+    assert tracker.requests == 10
+
+    client = FakeClient()
+    result, _ = _run(tmp_path, client, budget=None)
+    assert result == str(tmp_path / "skript.apkg")
+    assert client.requests == 0
+    with CardStore(str(tmp_path / "cards.sqlite")) as store:
+        assert len(store) == 10
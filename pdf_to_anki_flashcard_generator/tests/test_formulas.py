@@ -0,0 +1,42 @@
+import pytest
+
+from pdf_to_anki_flashcard_generator.formulas import MathSpan, extract_math_spans, formula_filename, replace_math_with_images, validate_math
+
+def test_extract_math_spans():
+    text = r"Es gilt \(a^2 + b^2 = c^2\) und \[\sum_{i=1}^n i = \frac{n(n+1)}{2}\]"
+    assert extract_math_spans(text) == [
+        MathSpan("a^2 + b^2 = c^2", display=False),
+        MathSpan(r"\sum_{i=1}^n i = \frac{n(n+1)}{2}", display=True),
+    ]
+
+@pytest.mark.parametrize("text", [
+    "Keine Formel",
+    r"Laufzeit \(O(n \log n)\)",
+    r"\[\left( \frac{a}{b} \right)\]",
+    r"\[\begin{pmatrix} 1 & 0 \\[2pt] 0 & 1 \end{pmatrix}\]",
+    r"Menge \(\{1, 2\}\)",
+])
+def test_validate_math_accepts_valid_formulas(text):
+    assert validate_math(text) == []
+
+@pytest.mark.parametrize("text, error", [
+    (r"Laufzeit \(O(n)", "unclosed"),
+    (r"Laufzeit O(n)\)", "unexpected"),
+    (r"\(\frac{a}{b\)", "unclosed '{'"),
+    (r"\(a}\)", "unmatched '}'"),
+    (r"\[\left( \frac{a}{b}\]", "\\left"),
+    (r"\[\begin{cases} x \end{matrix}\]", "\\end{matrix}"),
+    (r"\( \)", "empty formula"),
+])
+def test_validate_math_reports_errors(text, error):
+    errors = validate_math(text)
+    assert errors and any(error in message for message in errors)
+
+def test_formula_filename_is_content_addressed():
+    assert formula_filename(MathSpan("x^2", False)) == formula_filename(MathSpan(" x^2 ", False))
+    assert formula_filename(MathSpan("x^2", False)) != formula_filename(MathSpan("x^2", True))
+
+def test_replace_math_with_images_keeps_unrendered_formulas():
+    images = {MathSpan("x^2", False): "/cache/x2.png"}
+    text = r"\(x^2\) und \(y^2\)"
+    assert replace_math_with_images(text, images) == r'<img src="x2.png" class="formula-inline" alt="\(x^2\)"> und \(y^2\)'
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("click")
+pytest.importorskip("numpy")
+pytest.importorskip("genanki")
+
+from pdf_to_anki_flashcard_generator import main
+from pdf_to_anki_flashcard_generator.vector_index import VectorIndex
+
+CHUNKS = [
+    "Quicksort wählt ein Pivotelement und teilt das Array in zwei Hälften.",
+    "Mergesort teilt das Array rekursiv und fügt die sortierten Hälften zusammen.",
+    "Heapsort baut zuerst einen binären Max-Heap auf.",
+    "Die untere Schranke für vergleichsbasiertes Sortieren ist n log n.",
+    "Countingsort sortiert ganze Zahlen aus einem kleinen Wertebereich in linearer Zeit.",
+]
+
+class FakeClient:
+    """Stands in for the OpenAI client and answers every chunk with one card."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **kwargs):
+        question = messages[-1]["content"][-40:]
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=f"CARD 1:\nQ: Worum geht es in '{question}'?\nA: Sortieren."))],
+            usage=None,
+        )
+
+def test_processing_a_pdf_again_replaces_its_index_entries(tmp_path, monkeypatch):
+    contexts = []
+    related_context = main._related_context
+
+    def record_context(index, chunk_vector, context_k):
+        snippets = related_context(index, chunk_vector, context_k)
+        contexts.append(snippets)
+        return snippets
+
+    monkeypatch.setattr(main, "_related_context", record_context)
+    index_dir = str(tmp_path / "index")
+    for run in range(3):
+        contexts.clear()
+        output_file = main.generate_anki_deck(FakeClient(), str(tmp_path / "sortieren.pdf"), str(tmp_path / f"run{run}.apkg"),
+                                              f"Sortieren {run}", "model", 1800, "Basic", index_dir=index_dir, chunks=CHUNKS)
+        assert output_file is not None
+
+    # Every run sees the same context: the earlier chunks of the same PDF, without copies
+    assert [len(snippets) for snippets in contexts] == [0, 1, 2, 3, 3]
+    for snippets in contexts:
+        assert len(set(snippets)) == len(snippets)
+
+    with VectorIndex(index_dir) as index:
+        results = index.search(index.vectorizer.transform(["Quicksort Pivotelement"]), 5)[0]
+        texts = [result.text for result in results]
+        assert len(set(texts)) == len(texts)
+        assert all(result.deck == "Sortieren 2" for result in results)
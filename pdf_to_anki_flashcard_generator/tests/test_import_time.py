@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("click")
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing the CLI module must not pull in these; they are loaded inside the commands
+HEAVY_MODULES = ["fitz", "openai", "genanki", "dotenv", "httpx", "numpy"]
+# Cumulative import time of pdf_to_anki_flashcard_generator.main (click included)
+IMPORT_TIME_BUDGET_US = 500_000
+
+def _import_main() -> tuple[set[str], dict[str, int]]:
+    """Imports the CLI module in a fresh interpreter. Returns the heavy modules that were
+    loaded and the cumulative import time in microseconds per module."""
+    code = (
+        "import sys\n"
+        "import pdf_to_anki_flashcard_generator.main\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+    )
+    loaded = set(filter(None, result.stdout.strip().split(",")))
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, module = line.split("|")
+        cumulative[module.strip()] = int(cumulative_us)
+    return loaded, cumulative
+
+def test_heavy_dependencies_are_not_imported():
+    loaded, _ = _import_main()
+    assert loaded == set()
+
+def test_import_time_budget():
+    _, cumulative = _import_main()
+    assert cumulative["pdf_to_anki_flashcard_generator.main"] < IMPORT_TIME_BUDGET_US
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from pdf_to_anki_flashcard_generator import main
+
+@pytest.fixture(autouse=True)
+def openrouter_env(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_API_BASE", "http://localhost:5001/v1")
+    monkeypatch.setattr(main, "_client_registry", {})
+    monkeypatch.setattr(main, "_async_client_registry", {})
+
+def test_client_is_shared_per_process():
+    assert main.get_openrouter_client() is main.get_openrouter_client()
+    assert main.get_async_openrouter_client() is main.get_async_openrouter_client()
+
+def test_new_credentials_get_their_own_client(monkeypatch):
+    client = main.get_openrouter_client()
+    monkeypatch.setenv("OPENROUTER_API_KEY", "other-key")
+    assert main.get_openrouter_client() is not client
+
+def test_http_client_options(monkeypatch):
+    monkeypatch.setenv("OPENROUTER_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("OPENROUTER_POOL_TIMEOUT", "5")
+    options = main._http_client_options()
+    assert options["limits"].max_connections == 7
+    assert options["timeout"].pool == 5
+    assert main._http_client_options(pool_timeout=False)["timeout"].pool is None
@@ -0,0 +1,126 @@
+import os
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pdf_to_anki_flashcard_generator.vector_index import HashingVectorizer, VectorIndex
+
+TEXTS = [
+    "Quicksort hat im Mittel eine Laufzeit von O(n log n).",
+    "Die Zeitkomplexität von Mergesort ist immer O(n log n).",
+    "Ein Graph ist bipartit, wenn er keine ungeraden Kreise enthält.",
+]
+
+def test_vectorizer_is_normalised_and_deterministic():
+    vectorizer = HashingVectorizer(256)
+    vectors = vectorizer.transform(TEXTS + [""])
+    assert vectors.shape == (4, 256)
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert not vectors[3].any()
+    assert np.array_equal(vectors, HashingVectorizer(256).transform(TEXTS + [""]))
+
+def test_search_returns_best_matches_first(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256, block_size=2) as index:
+        index.add(index.vectorizer.transform(TEXTS), "chunk", "Algorithmen", TEXTS, "a.pdf")
+        assert len(index) == 3
+
+        query = index.vectorizer.transform(["Laufzeit von Quicksort"])
+        results = index.search(query, 2)[0]
+        assert [result.text for result in results][0] == TEXTS[0]
+        assert len(results) == 2
+        assert results[0].score >= results[1].score
+        assert results[0].deck == "Algorithmen" and results[0].source == "a.pdf"
+
+def test_search_filters_kind_and_source(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256) as index:
+        index.add(index.vectorizer.transform(TEXTS[:1]), "chunk", "A", TEXTS[:1], "a.pdf")
+        index.add(index.vectorizer.transform(TEXTS[1:2]), "card", "A", TEXTS[1:2], "a.pdf")
+        index.add(index.vectorizer.transform(TEXTS[2:]), "card", "B", TEXTS[2:], "b.pdf")
+        query = index.vectorizer.transform([TEXTS[1]])
+
+        assert [result.text for result in index.search(query, 5, kind="card")[0]] == [TEXTS[1], TEXTS[2]]
+        assert [result.text for result in index.search(query, 5, kind="card", exclude_source="a.pdf")[0]] == [TEXTS[2]]
+
+def test_reopen_keeps_entries_and_dim(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256) as index:
+        index.add(index.vectorizer.transform(TEXTS), "chunk", "A", TEXTS)
+    with VectorIndex(str(tmp_path)) as index:
+        assert index.dim == 256
+        assert len(index) == 3
+
+def test_add_discards_vectors_of_an_aborted_write(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256) as index:
+        index.add(index.vectorizer.transform(TEXTS[:1]), "chunk", "A", TEXTS[:1])
+        # A writer that died after appending vectors but before committing its items
+        with open(tmp_path / "vectors.f32", "ab") as f:
+            f.write(np.ones((2, 256), dtype=np.float32).tobytes())
+        index.add(index.vectorizer.transform(TEXTS[1:]), "chunk", "A", TEXTS[1:])
+
+        assert len(index) == 3
+        query = index.vectorizer.transform([TEXTS[2]])
+        assert index.search(query, 1)[0][0].text == TEXTS[2]
+
+def test_concurrent_indexes_assign_distinct_ids(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256) as first, VectorIndex(str(tmp_path), dim=256) as second:
+        for i, text in enumerate(TEXTS):
+            index = first if i % 2 else second
+            index.add(index.vectorizer.transform([text]), "chunk", "A", [text])
+        assert len(first) == 3
+    ids = [row[0] for row in sqlite3.connect(tmp_path / "items.sqlite").execute("SELECT id FROM items ORDER BY id")]
+    assert ids == [0, 1, 2]
+
+def _add_many(directory: str, worker: int) -> None:
+    with VectorIndex(directory, dim=256) as index:
+        for i in range(20):
+            text = f"Worker {worker} Eintrag {i}"
+            index.add(index.vectorizer.transform([text]), "chunk", "A", [text])
+
+def test_parallel_processes_keep_vectors_aligned(tmp_path):
+    import multiprocessing
+
+    # The workers create the index themselves
+    processes = [multiprocessing.Process(target=_add_many, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    with VectorIndex(str(tmp_path)) as index:
+        assert len(index) == 80
+        query = index.vectorizer.transform(["Worker 3 Eintrag 7"])
+        assert index.search(query, 1)[0][0].text == "Worker 3 Eintrag 7"
+
+def test_remove_source(tmp_path):
+    with VectorIndex(str(tmp_path), dim=256) as index:
+        index.add(index.vectorizer.transform(TEXTS[:2]), "chunk", "A", TEXTS[:2], "a.pdf")
+        index.add(index.vectorizer.transform(TEXTS[2:]), "card", "B", TEXTS[2:], "b.pdf")
+
+        assert index.remove_source("a.pdf") == 2
+        assert index.remove_source("a.pdf") == 0
+        query = index.vectorizer.transform([TEXTS[0]])
+        assert [result.text for result in index.search(query, 5)[0]] == [TEXTS[2]]
+        assert index.search(query, 5, kind="chunk")[0] == []
+
+        # Ids stay stable, new entries are appended after the removed ones
+        index.add(index.vectorizer.transform(TEXTS[:1]), "chunk", "A", TEXTS[:1], "a.pdf")
+        assert [result.text for result in index.search(query, 5)[0]][0] == TEXTS[0]
+        assert len(index.search(query, 5)[0]) == 2
+
+def _open_index(directory: str) -> None:
+    VectorIndex(directory, dim=256).close()
+
+def test_parallel_processes_create_a_fresh_index(tmp_path):
+    import multiprocessing
+
+    for attempt in range(10):
+        directory = str(tmp_path / str(attempt))
+        processes = [multiprocessing.Process(target=_open_index, args=(directory,)) for _ in range(8)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(30)
+            assert process.exitcode == 0
+        assert sorted(os.listdir(directory)) == ["index.json", "items.sqlite"]
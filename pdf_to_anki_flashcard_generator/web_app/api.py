@@ -1,101 +1,155 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
-import subprocess
+import re
 import tempfile
-import uuid
-from werkzeug.utils import secure_filename
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from artifact_store import ArtifactStore, InsufficientStorageError, UncachedResult, UploadTooLargeError
+from pdf_to_anki_flashcard_generator.card_store import CardStore
+from pdf_to_anki_flashcard_generator.main import extract_chunks, generate_anki_deck, get_openrouter_client, write_deck_from_store
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Content-Disposition', 'X-Result-Id'])
 
-UPLOAD_FOLDER = tempfile.gettempdir()
 ALLOWED_EXTENSIONS = {'pdf'}
+DEFAULT_MODEL = os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo")
+ANKI_MODEL_NAME = 'Basic (Simple Q&A)'
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+# Generated cards are cached next to the decks, but are not downloadable
+CARDS_SUFFIX = '.cards.sqlite'
+
+# Reject oversized requests before the form data is parsed
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024
+
+# Uploads and generated decks live in a content-addressed store: identical PDFs with
+# identical settings are processed once and served from the cache afterwards. The cards
+# are cached separately and independent of the deck name, so renaming a deck only
+# rebuilds the .apkg instead of repeating the LLM calls.
+artifact_store = ArtifactStore(
+    root=os.getenv("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "ankicardgen_artifacts")),
+    max_upload_bytes=MAX_UPLOAD_BYTES,
+    ttl_seconds=float(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 60 * 60))),
+    max_total_bytes=int(os.getenv("ARTIFACT_MAX_MB", "2048")) * 1024 * 1024,
+    min_free_bytes=int(os.getenv("ARTIFACT_MIN_FREE_MB", "512")) * 1024 * 1024,
+)
+
+# PyMuPDF is not thread-safe, so PDFs are extracted in a process pool. The LLM calls of a
+# job then run on a bounded thread pool; all threads share the process-wide Openrouter
+# client, so its pooled keep-alive connections are reused across uploads.
+extract_executor = ProcessPoolExecutor(max_workers=int(os.getenv("ANKICARDGEN_EXTRACT_WORKERS", str(os.cpu_count() or 1))))
+job_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ANKICARDGEN_WORKERS", "4")))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def send_result(result_path, result_id, deck_name):
+    # conditional=True enables Range, ETag and If-Modified-Since handling
+    response = send_file(
+        result_path,
+        as_attachment=True,
+        download_name=f"{deck_name}.apkg",
+        mimetype='application/octet-stream',
+        conditional=True
+    )
+    response.headers['X-Result-Id'] = result_id
+    return response
+
 @app.route('/api/process-pdf', methods=['POST'])
 def process_pdf():
+    artifact_store.maybe_cleanup()
+
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
-    
+
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
-    
+
     if not file or not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file format. Only PDF files are allowed.'}), 400
-    
+
     # Get form parameters
     deck_name = request.form.get('deckName', 'Generated Anki Deck')
     max_chars = request.form.get('maxChars', '1800')
-    
-    # Generate unique filenames
-    unique_id = str(uuid.uuid4())
-    pdf_filename = secure_filename(f"{unique_id}_{file.filename}")
-    output_filename = f"{unique_id}_output.apkg"
-    
-    pdf_path = os.path.join(UPLOAD_FOLDER, pdf_filename)
-    output_path = os.path.join(UPLOAD_FOLDER, output_filename)
-    
-    # Save uploaded PDF
-    file.save(pdf_path)
-    
     try:
-        # Build the command
-        command = [
-            "poetry", "run", "ankicardgen", "process-pdf-to-anki", 
-            pdf_path,
-            "--output-file", output_path,
-            "--deck-name", deck_name,
-            "--max-chars-per-chunk", max_chars
-        ]
-        
-        # Execute the command
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        
+        max_chars = int(max_chars)
+    except ValueError:
+        return jsonify({'error': 'maxChars must be an integer'}), 400
+
+    # Stream the uploaded PDF to disk
+    try:
+        pdf_path, pdf_hash = artifact_store.save_upload(file.stream)
+    except UploadTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except InsufficientStorageError as e:
+        return jsonify({'error': str(e)}), 507
+
+    try:
+        cards_id = artifact_store.result_key(pdf_hash, max_chars, DEFAULT_MODEL)
+        result_id = artifact_store.result_key(pdf_hash, deck_name, max_chars, DEFAULT_MODEL, ANKI_MODEL_NAME)
+
+        def build_cards(cards_path):
+            client = get_openrouter_client()
+            chunks = extract_executor.submit(extract_chunks, pdf_path, max_chars).result()
+            stats = {}
+            job = job_executor.submit(
+                generate_anki_deck,
+                client, pdf_path, None, deck_name, DEFAULT_MODEL, max_chars, ANKI_MODEL_NAME,
+                card_store_path=cards_path, stats=stats, chunks=chunks
+            )
+            cards_path = job.result()
+            if cards_path is not None and stats.get('failed_chunks'):
+                # Chunks lost to transient LLM errors: deliver the cards, but do not cache them
+                return UncachedResult(cards_path)
+            return cards_path
+
+        def build(output_path):
+            cards_path = artifact_store.get_or_create(cards_id, build_cards, suffix=CARDS_SUFFIX)
+            if cards_path is None:
+                return None
+            with CardStore(cards_path) as store:
+                deck_path = write_deck_from_store(store, output_path, deck_name, ANKI_MODEL_NAME)
+            if artifact_store.result_id(cards_path) != cards_id:
+                return UncachedResult(deck_path)
+            return deck_path
+
+        result_path = artifact_store.get_or_create(result_id, build)
+
         # Check if output file was created
-        if not os.path.exists(output_path):
-            return jsonify({
-                'error': 'Failed to generate Anki deck',
-                'output': result.stdout,
-                'error_output': result.stderr
-            }), 500
-        
+        if result_path is None:
+            return jsonify({'error': 'Failed to generate Anki deck'}), 500
+
         # Return the file for download
-        return send_file(
-            output_path,
-            as_attachment=True,
-            download_name=f"{deck_name}.apkg",
-            mimetype='application/octet-stream'
-        )
-    
-    except subprocess.CalledProcessError as e:
-        return jsonify({
-            'error': 'Process failed',
-            'output': e.stdout,
-            'error_output': e.stderr
-        }), 500
-    
+        return send_result(result_path, artifact_store.result_id(result_path), deck_name)
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    
+
     finally:
-        # Clean up temporary files
+        # Only the uploaded PDF is temporary; results stay cached until they expire
         if os.path.exists(pdf_path):
             os.remove(pdf_path)
-        if os.path.exists(output_path):
-            os.remove(output_path)
+
+@app.route('/api/results/<result_id>', methods=['GET'])
+def download_result(result_id):
+    if not re.fullmatch(r'[0-9a-f]{64}', result_id):
+        return jsonify({'error': 'Invalid result id'}), 400
+
+    result_path = artifact_store.get_result(result_id)
+    if result_path is None:
+        return jsonify({'error': 'Result not found or expired'}), 404
+
+    deck_name = request.args.get('deckName', 'Generated Anki Deck')
+    return send_result(result_path, result_id, deck_name)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Upload exceeds the maximum size of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.'}), 413
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'})
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    app.run(debug=True, port=5000)
@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import os
+import secrets
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Awaitable, BinaryIO, Callable, NamedTuple, Optional, Union
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured maximum size."""
+
+
+class InsufficientStorageError(Exception):
+    """Raised when the artifact directory is running out of free disk space."""
+
+
+class UncachedResult(NamedTuple):
+    """Returned by a build function for a result that must not be cached under its key,
+    e.g. a deck with chunks that failed because of transient LLM errors."""
+    path: str
+
+
+BuildResult = Union[str, UncachedResult, None]
+
+
+class ArtifactStore:
+    """Content-addressed on-disk store for uploaded PDFs and generated Anki decks.
+
+    Uploads are streamed to disk in chunks while being hashed. Generated decks (and the
+    card stores they are built from, see the `suffix` parameters) are kept under a key
+    derived from the PDF hash and the generation parameters, so identical uploads are
+    processed once and then served from the cache. Results expire after
+    `ttl_seconds` and the oldest results are evicted when the store grows beyond
+    `max_total_bytes`.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_upload_bytes: int,
+        ttl_seconds: float,
+        max_total_bytes: int,
+        min_free_bytes: int,
+        cleanup_interval: float = 300,
+        chunk_size: int = 1024 * 1024,
+    ):
+        self.incoming_dir = os.path.join(root, "incoming")
+        self.results_dir = os.path.join(root, "results")
+        os.makedirs(self.incoming_dir, exist_ok=True)
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.max_upload_bytes = max_upload_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_total_bytes = max_total_bytes
+        self.min_free_bytes = min_free_bytes
+        self.cleanup_interval = cleanup_interval
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._async_inflight: dict[str, asyncio.Task] = {}
+        self._last_cleanup = 0.0
+
+    def save_upload(self, stream: BinaryIO) -> tuple[str, str]:
+        """Streams an upload to disk in chunks and returns (path, sha256 hex digest).
+        Raises UploadTooLargeError if the upload exceeds the maximum size."""
+        if shutil.disk_usage(self.incoming_dir).free < self.min_free_bytes:
+            raise InsufficientStorageError("Not enough free disk space to accept the upload.")
+
+        path = os.path.join(self.incoming_dir, f"{uuid.uuid4()}.pdf")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(path, "wb") as out:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_upload_bytes:
+                        raise UploadTooLargeError(
+                            f"Upload exceeds the maximum size of {self.max_upload_bytes // (1024 * 1024)} MB."
+                        )
+                    digest.update(chunk)
+                    out.write(chunk)
+        except BaseException:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path, digest.hexdigest()
+
+    @staticmethod
+    def result_key(pdf_hash: str, *params: object) -> str:
+        """Derives the cache key of a result from the PDF hash and the generation parameters."""
+        key_source = "\0".join([pdf_hash, *(str(param) for param in params)])
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def _result_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.results_dir, f"{key}{suffix}")
+
+    def _partial_path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.results_dir, f"{key}.{uuid.uuid4()}.partial{suffix}")
+
+    @staticmethod
+    def result_id(path: str) -> str:
+        """Returns the id under which a result path can be fetched with get_result()."""
+        return os.path.basename(path).split(".", 1)[0]
+
+    def _publish(self, key: str, built: BuildResult, suffix: str) -> Optional[str]:
+        # os.replace is atomic, so readers never see a half-written result
+        if built is None:
+            return None
+        if isinstance(built, UncachedResult):
+            # Reachable under a random id, so later uploads with the same key rebuild it
+            path = self._result_path(secrets.token_hex(32), suffix)
+            os.replace(built.path, path)
+            return path
+        path = self._result_path(key, suffix)
+        os.replace(built, path)
+        return path
+
+    def get_result(self, key: str, suffix: str = ".apkg") -> Optional[str]:
+        """Returns the path of a cached, unexpired result, or None."""
+        path = self._result_path(key, suffix)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            # Refresh the timestamp so popular results survive TTL and size-based eviction.
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_create(self, key: str, build: Callable[[str], BuildResult], suffix: str = ".apkg") -> Optional[str]:
+        """Returns the cached result for `key`, building it with `build(output_path)` if needed.
+
+        Concurrent calls for the same key wait for a single build instead of repeating it.
+        `build` must write the result (a deck, or another artifact with the file name
+        `suffix`) to the given path and return it, or return None if nothing could be
+        generated. A result returned as UncachedResult is handed to the waiting callers but
+        not cached; use result_id() on the returned path to refer to it.
+        """
+        with self._lock:
+            path = self.get_result(key, suffix)
+            if path is not None:
+                return path
+            future = self._inflight.get(key)
+            is_builder = future is None
+            if is_builder:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_builder:
+            return future.result()
+
+        partial_path = self._partial_path(key, suffix)
+        try:
+            path = self._publish(key, build(partial_path), suffix)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    async def aget_or_create(self, key: str, build: Callable[[str], Awaitable[BuildResult]], suffix: str = ".apkg") -> Optional[str]:
+        """Async variant of get_or_create for use on a single asyncio event loop.
+
+        `build` is a coroutine function with the same contract. It is called before this
+        method first suspends, and its coroutine runs in a task owned by the store: a caller
+        that is cancelled (e.g. because its client disconnected) stops waiting, but neither
+        cancels the build nor the other callers waiting for it.
+        """
+        path = self.get_result(key, suffix)
+        if path is not None:
+            return path
+        task = self._async_inflight.get(key)
+        if task is None:
+            partial_path = self._partial_path(key, suffix)
+            task = asyncio.get_running_loop().create_task(self._abuild(key, build(partial_path), partial_path, suffix))
+            self._async_inflight[key] = task
+            task.add_done_callback(lambda done: self._abuild_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _abuild(self, key: str, built: Awaitable[BuildResult], partial_path: str, suffix: str) -> Optional[str]:
+        try:
+            return self._publish(key, await built, suffix)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _abuild_done(self, key: str, task: asyncio.Task) -> None:
+        if self._async_inflight.get(key) is task:
+            del self._async_inflight[key]
+        # Mark the exception as retrieved in case every caller stopped waiting
+        if not task.cancelled():
+            task.exception()
+
+    def maybe_cleanup(self) -> None:
+        """Runs cleanup() if the last run is longer than `cleanup_interval` ago."""
+        with self._lock:
+            now = time.time()
+            if now - self._last_cleanup < self.cleanup_interval:
+                return
+            self._last_cleanup = now
+        self.cleanup()
+
+    def cleanup(self) -> None:
+        """Removes expired results and stale uploads, then evicts the least recently used
+        results until the store fits into `max_total_bytes`."""
+        now = time.time()
+        results = []
+        for directory in (self.incoming_dir, self.results_dir):
+            for entry in os.scandir(directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                # Partial results and uploads belong to running jobs; only remove them if abandoned.
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(entry.path)
+                elif directory == self.results_dir and ".partial." not in entry.name:
+                    results.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in results)
+        for _, size, path in sorted(results):
+            if total_bytes <= self.max_total_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,252 @@
+"""ASGI variant of api.py for high-concurrency deployments.
+
+Serves the same endpoints as the Flask app, but runs the generation pipeline natively on
+asyncio: LLM requests are awaited on the event loop instead of occupying a thread each,
+and CPU-bound PDF extraction runs in a process pool. Start it with run_asgi_api.sh.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from artifact_store import ArtifactStore, InsufficientStorageError, UncachedResult, UploadTooLargeError
+from pdf_to_anki_flashcard_generator.async_pipeline import agenerate_anki_deck
+from pdf_to_anki_flashcard_generator.card_store import CardStore
+from pdf_to_anki_flashcard_generator.main import get_async_openrouter_client, write_deck_from_store
+
+ALLOWED_EXTENSIONS = {'pdf'}
+DEFAULT_MODEL = os.getenv("OPENROUTER_DEFAULT_MODEL", "openai/gpt-3.5-turbo")
+ANKI_MODEL_NAME = 'Basic (Simple Q&A)'
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+# Leaves room for the other form fields and the multipart framing
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 1024 * 1024
+# Generated cards are cached next to the decks (independent of the deck name), but are not downloadable
+CARDS_SUFFIX = '.cards.sqlite'
+LLM_CONCURRENCY_PER_JOB = int(os.getenv("ASGI_LLM_CONCURRENCY", "8"))
+# All jobs share one Openrouter client; its pool has OPENROUTER_MAX_CONNECTIONS sockets.
+# Bounding the in-flight LLM requests of all jobs to that size makes excess requests queue
+# here instead of timing out while waiting for a pooled connection.
+LLM_MAX_INFLIGHT = int(os.getenv("ASGI_LLM_MAX_INFLIGHT", os.getenv("OPENROUTER_MAX_CONNECTIONS", "20")))
+EXTRACT_WORKERS = int(os.getenv("ASGI_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+artifact_store = ArtifactStore(
+    root=os.getenv("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "ankicardgen_artifacts")),
+    max_upload_bytes=MAX_UPLOAD_BYTES,
+    ttl_seconds=float(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 60 * 60))),
+    max_total_bytes=int(os.getenv("ARTIFACT_MAX_MB", "2048")) * 1024 * 1024,
+    min_free_bytes=int(os.getenv("ARTIFACT_MIN_FREE_MB", "512")) * 1024 * 1024,
+)
+
+# Created in lifespan(); worker processes must not be forked before the server starts
+extract_executor = None
+llm_semaphore = asyncio.Semaphore(LLM_MAX_INFLIGHT)
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+def result_response(result_path, result_id, deck_name):
+    # FileResponse handles Range requests and conditional headers
+    return FileResponse(
+        result_path,
+        filename=f"{deck_name}.apkg",
+        media_type='application/octet-stream',
+        headers={'X-Result-Id': result_id},
+    )
+
+def limit_body(request, max_bytes):
+    """Returns a view of `request` whose body raises UploadTooLargeError after `max_bytes`.
+    Unlike a Content-Length check, this also stops chunked uploads before they are spooled to disk."""
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > max_bytes:
+                raise UploadTooLargeError(f'Upload exceeds the maximum size of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+        return message
+
+    return Request(request.scope, receive)
+
+def write_deck(cards_path, output_path, deck_name):
+    with CardStore(cards_path) as store:
+        return write_deck_from_store(store, output_path, deck_name, ANKI_MODEL_NAME)
+
+async def run_job(pdf_path, pdf_hash, result_id, deck_name, max_chars, on_progress=None):
+    """Generates (or fetches from the cache) the deck for an uploaded PDF and removes the upload afterwards.
+    The cards are cached independent of the deck name, so a cache miss caused only by
+    another deck name rebuilds just the .apkg."""
+    upload_in_use = False
+    cards_id = artifact_store.result_key(pdf_hash, max_chars, DEFAULT_MODEL)
+
+    async def generate_cards(cards_path):
+        client = get_async_openrouter_client()
+        stats = {}
+        cards_path = await agenerate_anki_deck(
+            client, pdf_path, None, deck_name, DEFAULT_MODEL, max_chars, ANKI_MODEL_NAME,
+            executor=extract_executor,
+            concurrency=LLM_CONCURRENCY_PER_JOB,
+            llm_semaphore=llm_semaphore,
+            on_progress=on_progress,
+            stats=stats,
+            card_store_path=cards_path,
+        )
+        if cards_path is not None and stats.get('failed_chunks'):
+            # Chunks lost to transient LLM errors: deliver the cards, but do not cache them
+            return UncachedResult(cards_path)
+        return cards_path
+
+    async def generate(output_path):
+        try:
+            cards_path = await artifact_store.aget_or_create(cards_id, generate_cards, suffix=CARDS_SUFFIX)
+        finally:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+        if cards_path is None:
+            return None
+        # Writing the .apkg is blocking file and SQLite I/O, keep it off the event loop
+        deck_path = await asyncio.to_thread(write_deck, cards_path, output_path, deck_name)
+        if artifact_store.result_id(cards_path) != cards_id:
+            return UncachedResult(deck_path)
+        return deck_path
+
+    def build(output_path):
+        nonlocal upload_in_use
+        upload_in_use = True
+        return generate(output_path)
+
+    try:
+        return await artifact_store.aget_or_create(result_id, build)
+    finally:
+        # Once the build started it owns the upload, as it may outlive this request
+        if not upload_in_use and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
+def stream_progress(pdf_path, pdf_hash, result_id, deck_name, max_chars):
+    """Runs the job in the background and streams its progress as newline-delimited JSON.
+    The last event is either `done` (with the id for /api/results) or `error`."""
+    queue = asyncio.Queue()
+    job = asyncio.create_task(run_job(pdf_path, pdf_hash, result_id, deck_name, max_chars, on_progress=queue.put_nowait))
+    job.add_done_callback(lambda _: queue.put_nowait(None))
+
+    async def events():
+        while (event := await queue.get()) is not None:
+            yield json.dumps(event) + "\n"
+        try:
+            result_path = job.result()
+        except Exception as e:
+            yield json.dumps({'event': 'error', 'error': str(e)}) + "\n"
+            return
+        if result_path is None:
+            yield json.dumps({'event': 'error', 'error': 'Failed to generate Anki deck'}) + "\n"
+        else:
+            yield json.dumps({'event': 'done', 'result_id': artifact_store.result_id(result_path)}) + "\n"
+
+    return StreamingResponse(events(), media_type='application/x-ndjson', headers={'X-Result-Id': result_id})
+
+async def process_pdf(request):
+    await asyncio.to_thread(artifact_store.maybe_cleanup)
+
+    # Reject oversized requests before the form data is parsed
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_REQUEST_BYTES:
+        return error(f'Upload exceeds the maximum size of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.', 413)
+
+    # The header is optional (chunked transfer encoding), so count the bytes while parsing as well
+    try:
+        form = await limit_body(request, MAX_REQUEST_BYTES).form()
+    except UploadTooLargeError as e:
+        return error(str(e), 413)
+    file = form.get('file')
+    if file is None or isinstance(file, str):
+        return error('No file part', 400)
+
+    if file.filename == '':
+        return error('No selected file', 400)
+
+    if not allowed_file(file.filename):
+        return error('Invalid file format. Only PDF files are allowed.', 400)
+
+    # Get form parameters
+    deck_name = form.get('deckName', 'Generated Anki Deck')
+    max_chars = form.get('maxChars', '1800')
+    try:
+        max_chars = int(max_chars)
+    except ValueError:
+        return error('maxChars must be an integer', 400)
+
+    # Stream the uploaded PDF to disk without blocking the event loop
+    try:
+        pdf_path, pdf_hash = await asyncio.to_thread(artifact_store.save_upload, file.file)
+    except UploadTooLargeError as e:
+        return error(str(e), 413)
+    except InsufficientStorageError as e:
+        return error(str(e), 507)
+    finally:
+        await form.close()
+
+    result_id = artifact_store.result_key(pdf_hash, deck_name, max_chars, DEFAULT_MODEL, ANKI_MODEL_NAME)
+
+    if request.query_params.get('stream') == '1':
+        return stream_progress(pdf_path, pdf_hash, result_id, deck_name, max_chars)
+
+    try:
+        result_path = await run_job(pdf_path, pdf_hash, result_id, deck_name, max_chars)
+    except Exception as e:
+        return error(str(e), 500)
+
+    if result_path is None:
+        return error('Failed to generate Anki deck', 500)
+
+    return result_response(result_path, artifact_store.result_id(result_path), deck_name)
+
+async def download_result(request):
+    result_id = request.path_params['result_id']
+    if not re.fullmatch(r'[0-9a-f]{64}', result_id):
+        return error('Invalid result id', 400)
+
+    result_path = artifact_store.get_result(result_id)
+    if result_path is None:
+        return error('Result not found or expired', 404)
+
+    deck_name = request.query_params.get('deckName', 'Generated Anki Deck')
+    return result_response(result_path, result_id, deck_name)
+
+async def health_check(request):
+    return JSONResponse({'status': 'ok'})
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global extract_executor
+    extract_executor = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    try:
+        yield
+    finally:
+        extract_executor.shutdown(cancel_futures=True)
+
+app = Starlette(
+    routes=[
+        Route('/api/process-pdf', process_pdf, methods=['POST']),
+        Route('/api/results/{result_id}', download_result, methods=['GET']),
+        Route('/api/health', health_check, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                   expose_headers=['Content-Disposition', 'X-Result-Id']),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,73 @@
+"""Load test for the web API: fires many concurrent uploads and reports latencies.
+
+Point the API at mock_openrouter.py to measure the server rather than the LLM:
+
+    MOCK_LLM_DELAY=2 uvicorn mock_openrouter:app --port 5001
+    OPENROUTER_API_BASE=http://localhost:5001/v1 OPENROUTER_API_KEY=mock uvicorn asgi_api:app --port 5000
+    python load_test.py ../examples/data/Komplexität.pdf --requests 300 --concurrency 300 --unique
+
+`--unique` gives every request its own deck name, so the result cache does not
+short-circuit generation.
+"""
+import argparse
+import asyncio
+import collections
+import statistics
+import time
+
+import httpx
+
+async def upload(client, url, pdf_bytes, filename, deck_name, max_chars):
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            url,
+            files={'file': (filename, pdf_bytes, 'application/pdf')},
+            data={'deckName': deck_name, 'maxChars': str(max_chars)},
+        )
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    return status, time.perf_counter() - started
+
+async def run(args):
+    with open(args.pdf, 'rb') as f:
+        pdf_bytes = f.read()
+    filename = args.pdf.rsplit('/', 1)[-1]
+    url = args.url.rstrip('/') + '/api/process-pdf'
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def one(i):
+            async with semaphore:
+                deck_name = f"Load Test {i}" if args.unique else "Load Test"
+                return await upload(client, url, pdf_bytes, filename, deck_name, args.max_chars)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    statuses = collections.Counter(status for status, _ in results)
+    latencies = sorted(latency for status, latency in results if status == 200)
+    print(f"Requests:    {args.requests} (concurrency {args.concurrency})")
+    print(f"Duration:    {elapsed:.2f} s ({args.requests / elapsed:.1f} req/s)")
+    print(f"Status:      {dict(statuses)}")
+    if latencies:
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"Latency:     p50 {statistics.median(latencies):.2f} s, p95 {p95:.2f} s, max {latencies[-1]:.2f} s")
+    return 0 if statuses.get(200) == args.requests else 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pdf', help='PDF file to upload')
+    parser.add_argument('--url', default='http://localhost:5000', help='Base URL of the API')
+    parser.add_argument('--requests', type=int, default=100, help='Total number of uploads')
+    parser.add_argument('--concurrency', type=int, default=100, help='Uploads in flight at the same time')
+    parser.add_argument('--max-chars', type=int, default=1800, help='maxChars form value')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-request timeout in seconds')
+    parser.add_argument('--unique', action='store_true', help='Use a distinct deck name per request to bypass the result cache')
+    raise SystemExit(asyncio.run(run(parser.parse_args())))
+
+if __name__ == '__main__':
+    main()
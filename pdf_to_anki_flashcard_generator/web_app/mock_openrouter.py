@@ -0,0 +1,42 @@
+"""Minimal stand-in for the Openrouter chat completions endpoint, used by load_test.py.
+
+Answers every request with two fixed flashcards after MOCK_LLM_DELAY seconds, so load
+tests measure how the API handles many uploads waiting on LLM I/O without API costs:
+
+    MOCK_LLM_DELAY=2 uvicorn mock_openrouter:app --port 5001
+"""
+import asyncio
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+MOCK_LLM_DELAY = float(os.getenv("MOCK_LLM_DELAY", "2"))
+
+MOCK_RESPONSE = """CARD 1:
+Q: Welche Zeitkomplexität hat die binäre Suche?
+A: Die binäre Suche hat eine Zeitkomplexität von \\(O(\\log n)\\).
+
+CARD 2:
+Q: Welche Zeitkomplexität hat Bubble Sort im schlechtesten Fall?
+A: Bubble Sort benötigt im schlechtesten Fall \\(O(n^2)\\) Vergleiche."""
+
+async def chat_completions(request):
+    body = await request.json()
+    await asyncio.sleep(MOCK_LLM_DELAY)
+    return JSONResponse({
+        'id': 'mock-completion',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'mock'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': MOCK_RESPONSE},
+            'finish_reason': 'stop',
+        }],
+        'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+    })
+
+app = Starlette(routes=[Route('/v1/chat/completions', chat_completions, methods=['POST'])])
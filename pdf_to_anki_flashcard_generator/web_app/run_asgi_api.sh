@@ -0,0 +1,5 @@
+#!/bin/bash
+cd "$(dirname "$0")"
+pip install -r requirements.txt
+# One worker process is enough: requests waiting on the LLM do not occupy threads
+uvicorn asgi_api:app --port 5000 --workers 1